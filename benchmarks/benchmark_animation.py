@@ -0,0 +1,75 @@
+# Project and Title: Global Stocktake Toolkit - animation benchmark
+
+# Purpose:
+# Compares the cost of one frame of make_histogram_animation (only the bar heights and
+# text change) with a full make_histogram call for the same year (new figure, styling,
+# binning and annotations). Both write PNGs at the same resolution.
+# Everything runs offline on synthetic data; the plots are written to a temporary folder.
+
+# Usage (from the repository root):
+#     python benchmarks/benchmark_animation.py [--countries 200] [--years 30] [--dpi 150]
+
+# =====================================================
+
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_root)
+
+import gst_tools.gst_utils as utils
+import gst_tools.make_plots as make_plots
+
+from synthetic_data import make_synthetic_data
+
+# ======================
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Animation frame cost vs make_histogram.')
+    parser.add_argument('--countries', type=int, default=200)
+    parser.add_argument('--years', type=int, default=30)
+    parser.add_argument('--dpi', type=int, default=150)
+    args = parser.parse_args()
+
+    data = make_synthetic_data(n_countries=args.countries, n_years=args.years, n_variables=1)
+    data_years = utils.set_countries_as_index(data)
+    years = list(data_years.columns)
+
+    make_plots.import_plotting_modules()
+    make_plots.plt.rcParams['savefig.dpi'] = args.dpi
+
+    working_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                make_plots.make_histogram_animation(data_years, 'Gg', output_format='png', dpi=args.dpi,
+                                                    remove_outliers=True, plot_name='benchmark', verbose=False)
+                animation_time = (time.perf_counter() - start) / len(years)
+
+                start = time.perf_counter()
+                for year in years:
+                    make_plots.make_histogram(data_years[year].dropna(), 'Gg', remove_outliers=True,
+                                              plot_name='benchmark-' + year)
+                    make_plots.plt.savefig('histogram-' + year + '.png', dpi=args.dpi, bbox_inches='tight')
+                    make_plots.plt.close('all')
+                histogram_time = (time.perf_counter() - start) / len(years)
+        finally:
+            os.chdir(working_dir)
+
+    print('{} countries, {} years, {} dpi'.format(args.countries, args.years, args.dpi))
+    print('animation frame:    {:.4f} s'.format(animation_time))
+    print('make_histogram:     {:.4f} s'.format(histogram_time))
+    print('frame / histogram:  {:.0%}'.format(animation_time / histogram_time))
+
+
+if __name__ == '__main__':
+    main()
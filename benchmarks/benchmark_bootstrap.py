@@ -0,0 +1,79 @@
+# Project and Title: Global Stocktake Toolkit - bootstrap throughput benchmark
+
+# Purpose:
+# Measures how many bootstrap replicates per second bootstrap_distribution_stats
+# calculates (for all years of an indicator at once) and compares it to resampling
+# each year separately in a Python loop.
+# Everything runs offline on synthetic data.
+
+# Usage (from the repository root):
+#     python benchmarks/benchmark_bootstrap.py [--countries 200] [--years 60] [--replicates 1000]
+
+# =====================================================
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_root)
+
+import gst_tools.gst_utils as utils
+from gst_tools.bootstrap import bootstrap_distribution_stats
+
+from synthetic_data import make_synthetic_data
+
+# ======================
+
+
+def loop_bootstrap(df, n_replicates, seed=0):
+
+    """
+    Reference: a replicate at a time, a year at a time.
+    """
+
+    rng = np.random.RandomState(seed)
+    for year in df.columns:
+        values = df[year].dropna().values
+        means = []
+        medians = []
+        for _ in range(n_replicates):
+            sample = values[rng.randint(0, len(values), size=len(values))]
+            means.append(sample.mean())
+            medians.append(np.median(sample))
+        np.percentile(means, [2.5, 97.5])
+        np.percentile(medians, [2.5, 97.5])
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Bootstrap throughput on synthetic data.')
+    parser.add_argument('--countries', type=int, default=200)
+    parser.add_argument('--years', type=int, default=60)
+    parser.add_argument('--replicates', type=int, default=1000)
+    args = parser.parse_args()
+
+    data = make_synthetic_data(n_countries=args.countries, n_years=args.years, n_variables=1)
+    data_years = utils.set_countries_as_index(data)
+
+    start = time.perf_counter()
+    bootstrap_distribution_stats(data_years, n_replicates=args.replicates)
+    vectorised_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    loop_bootstrap(data_years, args.replicates)
+    loop_time = time.perf_counter() - start
+
+    n_samples = args.replicates * args.years
+    print('{} countries, {} years, {} replicates'.format(args.countries, args.years, args.replicates))
+    print('vectorised: {:8.3f} s  {:12,.0f} replicate-years / s'.format(vectorised_time, n_samples / vectorised_time))
+    print('loop:       {:8.3f} s  {:12,.0f} replicate-years / s (mean and median only)'.format(
+          loop_time, n_samples / loop_time))
+    print('speed-up:   {:8.1f} x'.format(loop_time / vectorised_time))
+
+
+if __name__ == '__main__':
+    main()
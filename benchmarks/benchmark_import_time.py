@@ -0,0 +1,93 @@
+# Project and Title: Global Stocktake Toolkit - import time benchmark
+
+# Purpose:
+# Checks that importing gst_tools does not pull in the plotting libraries and
+# compares the start-up time of a data-only job with one that makes plots.
+# Each case is run in a fresh python process so that nothing is already imported.
+
+# Usage (from the repository root):
+#     python benchmarks/benchmark_import_time.py [--repeats 5] [--min-speedup 2]
+
+# =====================================================
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+# ======================
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+import_cases = {
+    'import gst_tools': 'import gst_tools',
+    'import gst_tools.gst_utils': 'import gst_tools.gst_utils',
+    'gst_tools + plotting stack': 'import gst_tools; gst_tools.make_plots.import_plotting_modules()',
+}
+
+plotting_modules = ['matplotlib', 'seaborn', 'shortcountrynames']
+
+
+def time_import(statement, repeats=5):
+
+    """
+    Runs the statement in a fresh interpreter 'repeats' times and returns the fastest wall time in seconds.
+    """
+
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], cwd=repo_root, check=True)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def find_plotting_modules_loaded(statement):
+
+    """
+    Returns the plotting modules that are loaded after running the statement.
+    """
+
+    check = (statement + '; import sys; print(",".join(m for m in ' + repr(plotting_modules) +
+             ' if m in sys.modules))')
+    result = subprocess.run([sys.executable, '-c', check], cwd=repo_root, check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True)
+
+    return [m for m in result.stdout.strip().split(',') if m]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark the import time of gst_tools.')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--min-speedup', type=float, default=2.,
+                        help='fail if the data-only import is not at least this much faster than the plotting stack')
+    args = parser.parse_args()
+
+    ok = True
+
+    loaded = find_plotting_modules_loaded('import gst_tools')
+    if loaded:
+        print('FAIL: importing gst_tools also imports ' + ', '.join(loaded))
+        ok = False
+
+    # python start-up time is subtracted so that the comparison is only the import itself
+    baseline = time_import('pass', repeats=args.repeats)
+    results = {}
+    for name, statement in import_cases.items():
+        results[name] = time_import(statement, repeats=args.repeats) - baseline
+        print('{:<30s} {:8.3f} s'.format(name, results[name]))
+
+    speedup = results['gst_tools + plotting stack'] / results['import gst_tools']
+    print('data-only import is {:.1f}x faster than importing the plotting stack'.format(speedup))
+    if speedup < args.min_speedup:
+        print('FAIL: expected a speed-up of at least {:.1f}x'.format(args.min_speedup))
+        ok = False
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
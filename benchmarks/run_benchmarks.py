@@ -0,0 +1,228 @@
+# Project and Title: Global Stocktake Toolkit - benchmark suite
+
+# Purpose:
+# Times the main gst_utils functions and make_plots renderers on synthetic data of
+# different sizes and records their peak memory. Results can be stored as a baseline
+# (JSON) and later runs are compared against it, so that regressions - e.g. after
+# updating pandas or seaborn - are flagged. Functions that fail are reported as errors,
+# which catches deprecated APIs that have been removed.
+# Everything runs offline.
+
+# A reference baseline (benchmarks/baseline.json, small and medium sizes) is included, so a
+# fresh checkout has something to compare against. Timings depend on the machine, so record
+# your own baseline before comparing changes, and only commit it when updating the reference.
+
+# Usage (from the repository root):
+#     python benchmarks/run_benchmarks.py --save-baseline
+#     python benchmarks/run_benchmarks.py [--sizes small medium] [--threshold 0.25]
+
+# =====================================================
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import contextlib
+
+import pandas as pd
+import numpy as np
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_root)
+
+import gst_tools.gst_utils as utils
+import gst_tools.make_plots as make_plots
+from gst_tools.bootstrap import bootstrap_distribution_stats
+
+from synthetic_data import make_synthetic_data
+
+# ======================
+
+default_baseline_file = os.path.join(repo_root, 'benchmarks', 'baseline.json')
+
+# (number of countries, number of years, number of variables)
+data_sizes = {
+    'small': (50, 30, 1),
+    'medium': (200, 60, 1),
+    'large': (2000, 100, 1),
+}
+
+
+def get_benchmark_cases(data):
+
+    """
+    Returns a dict of benchmark name -> function to call. Everything that is not being
+    timed (e.g. reformatting the input) is done here first.
+    """
+
+    data_years = utils.set_countries_as_index(data)
+    first_year = data_years.columns[0]
+    last_year = data_years.columns[-1]
+    mid_year = int(data_years.columns[len(data_years.columns) // 2])
+    other_data = data.iloc[::2]
+
+    peak_years = pd.to_numeric(data_years.dropna(axis=0, how='any').idxmax(axis=1))
+
+    # draw the figure as well, as most of the time is spent there rather than in setting up the plot
+    def render(plot_function, *args, **kwargs):
+        plot_function(*args, **kwargs)
+        make_plots.plt.gcf().canvas.draw()
+        make_plots.plt.close('all')
+
+    cases = {
+        'set_countries_as_index': lambda: utils.set_countries_as_index(data),
+        'check_column_order': lambda: utils.check_column_order(data),
+        'verify_data_format': lambda: utils.verify_data_format(data),
+        'calculate_trends': lambda: utils.calculate_trends(data_years, num_years_trend=5),
+        'change_first_year': lambda: utils.change_first_year(data_years, mid_year),
+        'calculate_diff_since_yearX': lambda: utils.calculate_diff_since_yearX(data_years, first_year),
+        'ensure_common_years': lambda: utils.ensure_common_years(data, other_data),
+        'ensure_common_countries': lambda: utils.ensure_common_countries(data, other_data),
+        'bootstrap_distribution_stats': lambda: bootstrap_distribution_stats(data_years, n_replicates=200),
+        'make_histogram': lambda: render(make_plots.make_histogram, data_years[last_year].dropna(), 'Gg',
+                                         remove_outliers=True, plot_name='benchmark'),
+        'make_histogram_peaking': lambda: render(make_plots.make_histogram_peaking, peak_years, 'benchmark', 'Gg',
+                                                 int(first_year), int(last_year)),
+    }
+
+    return cases
+
+
+def run_case(function, repeats=3):
+
+    """
+    Runs the function 'repeats' times and returns the fastest time (s), then runs it once more
+    with tracemalloc on to get the peak memory allocated (MB). All printing is suppressed.
+    """
+
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeats):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        function()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {'time_s': min(times), 'peak_mb': peak / 1e6}
+
+
+def run_benchmarks(sizes, repeats=3):
+
+    """
+    Runs all benchmark cases for the requested data sizes. Returns a dict of
+    'size/case' -> result, where the result is either times and memory or an error message.
+    """
+
+    make_plots.import_plotting_modules()
+
+    results = {}
+    for size in sizes:
+        n_countries, n_years, n_variables = data_sizes[size]
+        data = make_synthetic_data(n_countries=n_countries, n_years=n_years, n_variables=n_variables)
+
+        for name, function in get_benchmark_cases(data).items():
+            key = size + '/' + name
+            try:
+                results[key] = run_case(function, repeats=repeats)
+            except Exception as error:
+                results[key] = {'error': type(error).__name__ + ': ' + str(error)}
+            print_result(key, results[key])
+
+    return results
+
+
+def print_result(key, result):
+
+    if 'error' in result:
+        print('{:<40s} ERROR {}'.format(key, result['error']))
+    else:
+        print('{:<40s} {:10.4f} s {:10.2f} MB'.format(key, result['time_s'], result['peak_mb']))
+
+
+def compare_to_baseline(results, baseline, threshold=0.25):
+
+    """
+    Compares the results to the baseline and returns a list of regressions - cases that are
+    slower or use more memory than the baseline by more than the threshold (a fraction), or
+    that now fail.
+    """
+
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline['results']:
+            continue
+        reference = baseline['results'][key]
+
+        if 'error' in result:
+            if 'error' not in reference:
+                regressions.append(key + ' now fails: ' + result['error'])
+            continue
+        if 'error' in reference:
+            continue
+
+        for measure in ['time_s', 'peak_mb']:
+            if result[measure] > (1 + threshold) * reference[measure]:
+                regressions.append('{} {}: {:.4g} (baseline {:.4g})'.format(key, measure, result[measure],
+                                                                          reference[measure]))
+
+    return regressions
+
+
+def get_versions():
+
+    import matplotlib
+    import seaborn
+
+    versions = {'python': sys.version.split()[0], 'pandas': pd.__version__, 'numpy': np.__version__,
+                'matplotlib': matplotlib.__version__, 'seaborn': seaborn.__version__}
+
+    return versions
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark gst_tools on synthetic data.')
+    parser.add_argument('--sizes', nargs='+', default=['small', 'medium'], choices=list(data_sizes))
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--baseline', default=default_baseline_file)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store the results as the new baseline instead of comparing')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='relative increase in time or memory that counts as a regression')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, repeats=args.repeats)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'versions': get_versions(), 'results': results}, f, indent=1, sort_keys=True)
+        print('Baseline written to ' + args.baseline)
+        return
+
+    if not os.path.exists(args.baseline):
+        print('No baseline found at ' + args.baseline + ' - run with --save-baseline first.')
+        return
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+
+    regressions = compare_to_baseline(results, baseline, threshold=args.threshold)
+    if regressions:
+        print('---------')
+        print('Regressions compared to the baseline (' + str(baseline['versions']) + '):')
+        for regression in regressions:
+            print('   ' + regression)
+        sys.exit(1)
+
+    print('No regressions compared to the baseline.')
+
+
+if __name__ == '__main__':
+    main()
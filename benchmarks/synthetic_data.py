@@ -0,0 +1,65 @@
+# Project and Title: Global Stocktake Toolkit - synthetic data for benchmarks
+
+# Purpose:
+# Generates country-year data in the proc-data format (category, country, scenario,
+# source, unit, variable, years...) of any size, so that the gst_tools functions can
+# be benchmarked offline without the real datasets.
+
+# =====================================================
+
+import string
+import itertools
+
+import pandas as pd
+import numpy as np
+
+# ======================
+
+
+def make_country_codes(n_countries):
+
+    """
+    Returns n_countries unique three letter codes (AAA, AAB, ...).
+    """
+
+    codes = (''.join(letters) for letters in itertools.product(string.ascii_uppercase, repeat=3))
+
+    return list(itertools.islice(codes, n_countries))
+
+
+def make_synthetic_data(n_countries=200, n_years=30, n_variables=1, first_year=1990,
+                        nan_fraction=0.05, outlier_fraction=0.01, seed=0):
+
+    """
+    Makes a dataframe of synthetic data in the proc-data format with one row per country
+    and variable. Values follow a random walk in log space from a log-normal starting value,
+    so they look roughly like emissions. A fraction of the values are set to NaN (gaps) and a
+    fraction are multiplied by a large factor (outliers).
+    """
+
+    rng = np.random.RandomState(seed)
+
+    countries = make_country_codes(n_countries)
+    years = [str(year) for year in range(first_year, first_year + n_years)]
+    n_rows = n_countries * n_variables
+
+    start_values = rng.lognormal(mean=3, sigma=2, size=(n_rows, 1))
+    growth = rng.normal(loc=0.01, scale=0.05, size=(n_rows, n_years))
+    growth[:, 0] = 0
+    values = start_values * np.exp(np.cumsum(growth, axis=1))
+
+    outliers = rng.rand(n_rows, n_years) < outlier_fraction
+    values[outliers] = values[outliers] * 100
+
+    gaps = rng.rand(n_rows, n_years) < nan_fraction
+    values[gaps] = np.nan
+
+    data = pd.DataFrame(values, columns=years)
+    data.insert(0, 'category', 'IPC0')
+    data.insert(1, 'country', countries * n_variables)
+    data.insert(2, 'scenario', 'synthetic')
+    data.insert(3, 'source', 'synthetic')
+    data.insert(4, 'unit', 'Gg')
+    data.insert(5, 'variable', np.repeat(['variable-' + str(var) for var in range(n_variables)], n_countries))
+
+    return data
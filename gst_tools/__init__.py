@@ -2,5 +2,9 @@
 
 # init for gst_tools
 
+# Note that importing gst_tools does not import matplotlib or seaborn - they are only
+# imported when the first plot is made. Data-only jobs can also import just the data
+# tools, e.g. 'import gst_tools.gst_utils as utils', without any plotting functions.
+
 from .gst_utils import *
-from .make_plots import *
\ No newline at end of file
+from .make_plots import *
@@ -0,0 +1,142 @@
+# Project and Title: Global Stocktake Toolkit - bootstrap confidence intervals
+
+# Purpose: Bootstrap confidence intervals for the statistics shown on the histograms
+# (mean, median, quantiles, share of countries above / below zero). The countries are
+# resampled with replacement using one index matrix (replicates x countries) that is
+# drawn once from a seeded generator and applied to all years at the same time, so
+# the results are reproducible and the statistics of all replicates and years are
+# calculated with array reductions.
+
+# =====================================================
+
+import warnings
+
+import pandas as pd
+import numpy as np
+
+from .instrumentation import instrument
+
+# ======================
+
+default_bootstrap_quantiles = [0.25, 0.75]
+
+
+def draw_bootstrap_indices(n_countries, n_replicates=1000, seed=0):
+
+    """
+    Index matrix (replicates x countries) for resampling the countries with replacement,
+    from a seeded random generator.
+    """
+
+    rng = np.random.RandomState(seed)
+
+    return rng.randint(0, n_countries, size=(n_replicates, n_countries))
+
+
+def remove_tukey_outliers(values, ktuk=3):
+
+    """
+    Sets the values outside Tukey's fences (k = ktuk) of each column to NaN, as make_histogram
+    does when remove_outliers is True.
+    """
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        q25, q75 = np.nanpercentile(values, [25, 75], axis=0)
+    iqr = q75 - q25
+
+    with np.errstate(invalid='ignore'):
+        inside = (values > q25 - ktuk * iqr) & (values < q75 + ktuk * iqr)
+
+    return np.where(inside, values, np.nan)
+
+
+def sorted_quantiles(sorted_values, n_valid, quantiles):
+
+    """
+    Quantiles (linear interpolation, as np.percentile) along axis -2 of an array that is already
+    sorted along that axis with the NaNs at the end, and has n_valid values in each column.
+    """
+
+    results = []
+    for quantile in quantiles:
+        position = quantile * np.maximum(n_valid - 1, 0)
+        below = np.floor(position).astype(np.intp)
+        above = np.ceil(position).astype(np.intp)
+        value_below = np.take_along_axis(sorted_values, np.expand_dims(below, -2), axis=-2)[..., 0, :]
+        value_above = np.take_along_axis(sorted_values, np.expand_dims(above, -2), axis=-2)[..., 0, :]
+        result = value_below + (position - below) * (value_above - value_below)
+        results.append(np.where(n_valid > 0, result, np.nan))
+
+    return results
+
+
+def calculate_sample_stats(values, quantiles):
+
+    """
+    Statistics over the countries (axis -2) of an array (... x countries x years), ignoring NaNs.
+    The countries are sorted once and the median and quantiles are read off the sorted values.
+    Returns a dict of statistic name -> array (... x years).
+    """
+
+    valid = ~np.isnan(values)
+    n_valid = np.sum(valid, axis=-2)
+    sorted_values = np.sort(values, axis=-2)
+
+    quantile_values = sorted_quantiles(sorted_values, n_valid, [0.5] + list(quantiles or []))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats = {
+            'mean': np.sum(np.where(valid, values, 0.), axis=-2) / n_valid,
+            'median': quantile_values[0],
+            'share_above_zero': 100 * np.sum(values > 0, axis=-2) / n_valid,
+            'share_below_zero': 100 * np.sum(values < 0, axis=-2) / n_valid,
+        }
+
+    for quantile, quantile_value in zip(quantiles or [], quantile_values[1:]):
+        stats['q{:g}'.format(100 * quantile)] = quantile_value
+
+    return stats
+
+
+@instrument
+def bootstrap_distribution_stats(df, n_replicates=1000, confidence=0.95, quantiles=default_bootstrap_quantiles,
+                                 remove_outliers=False, ktuk=3, seed=0, batch_size=250):
+
+    """
+    Bootstrap confidence intervals of the mean, median, quantiles and the share (%) of countries
+    above and below zero, for every year of a dataframe (countries x years). If remove_outliers is
+    True, the outliers are removed first as in make_histogram (Tukey's fences, k = ktuk) - comparing
+    the two shows how much the outlier removal changes the statistics.
+    The replicates are calculated in batches of batch_size to limit the memory used.
+    Returns a dataframe with the years as index and columns (statistic, 'estimate' / 'lower' / 'upper').
+    """
+
+    values = df.values.astype(float)
+    if remove_outliers:
+        values = remove_tukey_outliers(values, ktuk=ktuk)
+
+    estimates = calculate_sample_stats(values, quantiles)
+    indices = draw_bootstrap_indices(values.shape[0], n_replicates=n_replicates, seed=seed)
+
+    # replicates x years for each statistic, filled batch by batch
+    replicates = {name: np.empty((n_replicates, values.shape[1])) for name in estimates}
+    for start in range(0, n_replicates, batch_size):
+        batch = indices[start:(start + batch_size)]
+        # batch x countries x years
+        batch_stats = calculate_sample_stats(values[batch], quantiles)
+        for name, stat in batch_stats.items():
+            replicates[name][start:(start + len(batch))] = stat
+
+    alpha = (1 - confidence) / 2
+    results = {}
+    for name, estimate in estimates.items():
+        lower, upper = np.percentile(replicates[name], [100 * alpha, 100 * (1 - alpha)], axis=0)
+        results[(name, 'estimate')] = estimate
+        results[(name, 'lower')] = lower
+        results[(name, 'upper')] = upper
+
+    results = pd.DataFrame(results, index=pd.Index(list(df.columns), name='year'))
+    results.columns.names = ['statistic', 'measure']
+
+    return results
@@ -0,0 +1,210 @@
+# Project and Title: Global Stocktake Toolkit - chunked aggregation of raw data
+
+# Purpose: Calculate derived totals (custom sector groupings, gas baskets with other
+# GWPs, ...) from the full PRIMAP-hist release without loading it into memory.
+# The raw file is read in chunks and every chunk is added to a preallocated
+# (aggregate, scenario, country, year) array, so the memory needed depends on the
+# size of the output and the chunk size, not on the size of the input file.
+
+# Example - a Kyoto basket with AR4 GWPs for the energy sector (as KYOTOGHGAR4):
+#     mapping = make_gas_basket_mapping('Energy-KyotoGHG-AR4', ['IPC1'], kyoto_ar4)
+#     aggregate_raw_data('input-data/PRIMAP-hist_v2.0_11-Dec-2018.csv', mapping,
+#                        source_name='PRIMAP-hist_v2.0')
+
+# =====================================================
+
+import os
+import re
+
+import pandas as pd
+import numpy as np
+
+from .instrumentation import instrument
+
+# ======================
+
+# Global warming potentials (100 year) for the individual gases in PRIMAP-hist.
+gwp_ar4 = {'CO2': 1, 'CH4': 25, 'N2O': 298, 'SF6': 22800, 'NF3': 17200}
+gwp_ar5 = {'CO2': 1, 'CH4': 28, 'N2O': 265, 'SF6': 23500, 'NF3': 16100}
+
+# The full Kyoto basket also needs the HFC and PFC baskets, which PRIMAP-hist only gives in
+# CO2eq (AR4 GWPs: HFCSAR4, PFCSAR4), so they are added as they are. With these, the totals
+# are the same as KYOTOGHGAR4. There are no AR5 HFC/PFC baskets in the data, so gwp_ar5 only
+# gives the basket of the individual gases, not a Kyoto basket.
+kyoto_ar4 = dict(gwp_ar4, HFCSAR4=1, PFCSAR4=1)
+
+# column names in PRIMAP-hist v2.0
+primap_hist_columns = {'country': 'country', 'category': 'category', 'entity': 'entity',
+                       'scenario': 'scenario', 'unit': 'unit'}
+
+
+def make_gas_basket_mapping(aggregate_name, categories, gwps):
+
+    """
+    Makes the mapping for one aggregate that sums all the gases in 'gwps' (a dict of
+    gas -> GWP) over all the given categories, e.g. a Kyoto basket under AR4 GWPs (kyoto_ar4).
+    """
+
+    mapping = {aggregate_name: {(category, gas): gwp for category in categories for gas, gwp in gwps.items()}}
+
+    return mapping
+
+
+def get_aggregate_unit(component_units, weighted=False):
+
+    """
+    Unit of an aggregate from the units of its components. A GWP-weighted sum, or one with
+    components already in CO2eq (the F-gas baskets), is in CO2eq, e.g. 'Gg' and 'GgCO2eq' give
+    'GgCO2eq'. Returns None if the components are in different units.
+    """
+
+    base_units = set(re.sub(r"\s*CO2eq$", '', component_unit) for component_unit in component_units)
+    if len(base_units) != 1:
+        return None
+
+    base_unit = list(base_units)[0]
+    if weighted or any(component_unit != base_unit for component_unit in component_units):
+        return base_unit + 'CO2eq'
+
+    return base_unit
+
+
+def find_year_columns(columns):
+
+    return [column for column in columns if re.match(r"Y?[0-9]{4}$", str(column)) is not None]
+
+
+def scan_raw_data(filename, columns=primap_hist_columns, chunksize=100000):
+
+    """
+    Quick first pass over the file that reads only the country and scenario columns, to
+    find out how big the output array needs to be.
+    """
+
+    countries = set()
+    scenarios = set()
+    for chunk in pd.read_csv(filename, usecols=[columns['country'], columns['scenario']],
+                             dtype=str, chunksize=chunksize):
+        countries.update(chunk[columns['country']].dropna().unique())
+        scenarios.update(chunk[columns['scenario']].dropna().unique())
+
+    return sorted(countries), sorted(scenarios)
+
+
+@instrument
+def aggregate_raw_data(filename, mapping, source_name='aggregated', unit=None,
+                       countries=None, scenarios=None, columns=primap_hist_columns,
+                       chunksize=100000, output_folder='proc-data', write_files=True):
+
+    """
+    Streams the raw data file and calculates new aggregates for every country, scenario and year.
+    'mapping' is a dict of aggregate name -> {(category, entity): weight}, e.g. weights can be
+    GWPs to make a gas basket or 1 to sum sectors (see make_gas_basket_mapping).
+    If countries or scenarios are not given, all those in the file are used. Missing values are
+    ignored; a country-year is only NaN in the output if none of its components has data.
+    Each aggregate and scenario is written to its own file in the proc-data format. If no unit is
+    given, the unit of the components is used (if they all have the same one), in CO2eq if any of
+    the weights isn't 1 or any component is already in CO2eq (see get_aggregate_unit).
+    Returns the aggregated data as a dict of (aggregate, scenario) -> dataframe.
+    """
+
+    header = pd.read_csv(filename, nrows=0)
+    year_columns = find_year_columns(header.columns)
+    metadata = [columns['country'], columns['category'], columns['entity'], columns['scenario'], columns['unit']]
+
+    if (countries is None) or (scenarios is None):
+        found_countries, found_scenarios = scan_raw_data(filename, columns=columns, chunksize=chunksize)
+        countries = found_countries if countries is None else countries
+        scenarios = found_scenarios if scenarios is None else scenarios
+
+    aggregates = list(mapping)
+
+    # table of which (category, entity) contributes to which aggregate, and with what weight
+    weights = pd.DataFrame([(category, entity, aggregate_index, weight)
+                            for aggregate_index, aggregate in enumerate(aggregates)
+                            for (category, entity), weight in mapping[aggregate].items()],
+                           columns=[columns['category'], columns['entity'], 'aggregate_index', 'weight'])
+
+    country_index = pd.Series(np.arange(len(countries)), index=countries)
+    scenario_index = pd.Series(np.arange(len(scenarios)), index=scenarios)
+
+    # preallocate the output, and keep track of where there is data (to tell zeros from gaps)
+    shape = (len(aggregates), len(scenarios), len(countries), len(year_columns))
+    totals = np.zeros(shape)
+    has_data = np.zeros(shape, dtype=bool)
+    units_found = [set() for _ in aggregates]
+
+    dtypes = {column: str for column in metadata}
+    dtypes.update({column: np.float64 for column in year_columns})
+
+    nrows = 0
+    for chunk in pd.read_csv(filename, usecols=metadata + year_columns, dtype=dtypes, chunksize=chunksize):
+        nrows += len(chunk)
+
+        # expand each row to all the aggregates it contributes to
+        chunk = chunk.merge(weights, on=[columns['category'], columns['entity']], how='inner')
+        chunk = chunk.loc[chunk[columns['country']].isin(country_index.index) &
+                          chunk[columns['scenario']].isin(scenario_index.index)]
+        if chunk.empty:
+            continue
+
+        aggregate_rows = chunk['aggregate_index'].values
+        scenario_rows = scenario_index[chunk[columns['scenario']]].values
+        country_rows = country_index[chunk[columns['country']]].values
+
+        values = chunk[year_columns].values
+        valid = ~np.isnan(values)
+        weighted_values = np.where(valid, values, 0.) * chunk['weight'].values[:, np.newaxis]
+
+        np.add.at(totals, (aggregate_rows, scenario_rows, country_rows), weighted_values)
+        np.logical_or.at(has_data, (aggregate_rows, scenario_rows, country_rows), valid)
+
+        for aggregate_number, chunk_unit in zip(aggregate_rows, chunk[columns['unit']]):
+            units_found[aggregate_number].add(chunk_unit)
+
+    print('Aggregated ' + str(nrows) + ' rows from ' + filename)
+
+    totals[~has_data] = np.nan
+    years = [column.lstrip('Y') for column in year_columns]
+
+    results = {}
+    for aggregate_number, aggregate in enumerate(aggregates):
+
+        weighted = any(weight != 1 for weight in mapping[aggregate].values())
+        component_unit = get_aggregate_unit(units_found[aggregate_number], weighted=weighted)
+
+        if unit is not None:
+            aggregate_unit = unit
+        elif component_unit is not None:
+            aggregate_unit = component_unit
+        else:
+            print('WARNING: the components of ' + aggregate + ' have different units ('
+                  + str(sorted(units_found[aggregate_number])) + '). Please specify the unit!')
+            aggregate_unit = 'mixed'
+
+        for scenario_number, scenario in enumerate(scenarios):
+
+            new_data = pd.DataFrame(totals[aggregate_number, scenario_number], index=countries, columns=years)
+            new_data = new_data.dropna(axis=0, how='all')
+            new_data.index.name = 'country'
+            new_data = new_data.reset_index()
+            new_data['scenario'] = scenario
+            new_data['source'] = source_name
+            new_data['unit'] = aggregate_unit
+            new_data['variable'] = aggregate
+            new_data = new_data[['country', 'scenario', 'source', 'unit', 'variable'] + years]
+
+            results[(aggregate, scenario)] = new_data
+
+            if write_files and not new_data.empty:
+                if len(scenarios) > 1:
+                    fname_out = source_name + '_' + aggregate + '_' + scenario + '.csv'
+                else:
+                    fname_out = source_name + '_' + aggregate + '.csv'
+                fullfname_out = os.path.join(output_folder, fname_out)
+                if not os.path.exists(output_folder):
+                    os.makedirs(output_folder)
+                new_data.to_csv(fullfname_out, index=False)
+                print('Processed data written to file! - ' + fullfname_out)
+
+    return results
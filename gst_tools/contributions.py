@@ -0,0 +1,145 @@
+# Project and Title: Global Stocktake Toolkit - contribution shares and Lorenz curves
+
+# Purpose: How concentrated is an indicator (e.g. emissions) across countries?
+#   - cumulative share of the total from the largest country down (top-N shares)
+#   - number of countries needed to reach a share of the total (e.g. 80%)
+#   - Lorenz curves (optionally population-weighted)
+# Each year column is sorted once and the shares are prefix sums over the sorted
+# countries, for all years at the same time. make_plots.make_cumulative_share_plot
+# plots the cumulative shares.
+
+# =====================================================
+
+import pandas as pd
+import numpy as np
+
+from .convergence import sort_with_weights
+from .gst_utils import align_datasets
+from .instrumentation import instrument
+
+# ======================
+
+default_top_n = [1, 5, 10, 20]
+default_share_thresholds = [50, 80, 90]
+
+
+@instrument
+def calculate_cumulative_shares(df):
+
+    """
+    Sorts the countries from the largest to the smallest value in every year and calculates the
+    cumulative share (%) of the year's total. Countries with no data are left out.
+    Returns the cumulative shares and the countries in that order, both with rank (1 = largest)
+    as index and years as columns.
+    """
+
+    values = df.values.astype(float)
+    valid = ~np.isnan(values)
+
+    # largest first; NaNs are sorted to the end
+    order = np.argsort(-values, axis=0, kind='mergesort')
+    sorted_values = np.take_along_axis(np.where(valid, values, 0.), order, axis=0)
+    sorted_valid = np.take_along_axis(valid, order, axis=0)
+
+    cumulative = np.cumsum(sorted_values, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shares = 100 * cumulative / cumulative[-1][np.newaxis, :]
+    shares[~sorted_valid] = np.nan
+
+    countries = np.array(df.index, dtype=object)[order]
+    countries[~sorted_valid] = None
+
+    rank = pd.Index(np.arange(1, values.shape[0] + 1), name='rank')
+    df_shares = pd.DataFrame(shares, index=rank, columns=df.columns)
+    df_countries = pd.DataFrame(countries, index=rank, columns=df.columns)
+
+    return df_shares, df_countries
+
+
+def get_top_n_shares(df_shares, top_n=default_top_n):
+
+    """
+    Share (%) of the total held by the N largest countries in each year, from the output of
+    calculate_cumulative_shares. Returns a dataframe with years as index and a column 'top_N' per N.
+    """
+
+    top_n = [n for n in top_n if n <= len(df_shares)]
+    top_n_shares = df_shares.loc[top_n].T
+    top_n_shares.columns = ['top_' + str(n) for n in top_n]
+    top_n_shares.index.name = 'year'
+
+    return top_n_shares
+
+
+def get_n_to_reach(df_shares, thresholds=default_share_thresholds):
+
+    """
+    Number of countries (largest first) needed to reach each threshold (% of the total) in each
+    year, from the output of calculate_cumulative_shares. Returns a dataframe with years as index
+    and a column 'n_for_X%' per threshold; NaN if the threshold isn't reached.
+    """
+
+    shares = df_shares.values
+    n_to_reach = {}
+    for threshold in thresholds:
+        with np.errstate(invalid='ignore'):
+            reached = shares >= threshold
+        n_to_reach['n_for_{:g}%'.format(threshold)] = np.where(reached.any(axis=0),
+                                                               np.argmax(reached, axis=0) + 1, np.nan)
+
+    return pd.DataFrame(n_to_reach, index=pd.Index(list(df_shares.columns), name='year'))
+
+
+@instrument
+def calculate_lorenz_curves(df, df_weights=None):
+
+    """
+    Lorenz curves of an indicator (countries x years) in every year: countries are sorted from
+    smallest to largest and the cumulative share (%) of countries - or of the weight, e.g. the
+    population, if df_weights is given - is matched with the cumulative share (%) of the total.
+    Returns the x (share of countries / weight) and y (share of total) of the curves, with
+    position as index and years as columns, each starting from (0, 0).
+    """
+
+    if df_weights is not None:
+        df, df_weights = align_datasets([df, df_weights])
+        weights = df_weights.values.astype(float)
+    else:
+        weights = np.ones(df.shape)
+
+    values = df.values.astype(float)
+    sorted_values, sorted_weights, cumulative_weights = sort_with_weights(values, weights)
+    cumulative_values = np.cumsum(sorted_weights * np.where(sorted_weights > 0, sorted_values, 0.), axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x = 100 * cumulative_weights / cumulative_weights[-1][np.newaxis, :]
+        y = 100 * cumulative_values / cumulative_values[-1][np.newaxis, :]
+
+    # countries without data are at the end - leave them out of the curves
+    x[sorted_weights == 0] = np.nan
+    y[sorted_weights == 0] = np.nan
+
+    zeros = np.zeros((1, values.shape[1]))
+    position = pd.Index(np.arange(values.shape[0] + 1), name='position')
+    lorenz_x = pd.DataFrame(np.vstack([zeros, x]), index=position, columns=list(df.columns))
+    lorenz_y = pd.DataFrame(np.vstack([zeros, y]), index=position, columns=list(df.columns))
+
+    return lorenz_x, lorenz_y
+
+
+@instrument
+def calculate_contribution_summary(indicators, top_n=default_top_n, thresholds=default_share_thresholds):
+
+    """
+    Top-N shares and the number of countries needed to reach each threshold, for every indicator
+    (dict of name -> dataframe, countries x years) and year. Returns one dataframe indexed by
+    (indicator, year).
+    """
+
+    summaries = {}
+    for name, df in indicators.items():
+        df_shares, df_countries = calculate_cumulative_shares(df)
+        summaries[name] = pd.concat([get_top_n_shares(df_shares, top_n=top_n),
+                                     get_n_to_reach(df_shares, thresholds=thresholds)], axis=1)
+
+    return pd.concat(summaries, names=['indicator'])
@@ -0,0 +1,166 @@
+# Project and Title: Global Stocktake Toolkit - convergence and inequality metrics
+
+# Purpose: Are countries converging? Inequality and dispersion of an indicator (e.g.
+# per capita emissions) across countries, for every year:
+#   - Gini coefficient and Theil index, unweighted and population-weighted
+#   - coefficient of variation (sigma-convergence), unweighted and population-weighted
+#   - interquantile ratios (e.g. 90th / 10th percentile)
+# Each year column is sorted once and everything is calculated from cumulative sums
+# over the sorted countries, for all years at the same time.
+
+# =====================================================
+
+import pandas as pd
+import numpy as np
+
+from .gst_utils import align_datasets
+from .instrumentation import instrument
+
+# ======================
+
+default_quantile_ratios = [(0.9, 0.1), (0.8, 0.2), (0.75, 0.25)]
+
+
+def sort_with_weights(values, weights):
+
+    """
+    Sorts each column of a 2D array (countries x years) with its weights. Missing values (and
+    values with missing weights) get zero weight and are sorted to the end. Returns the sorted
+    values, sorted weights and the cumulative sum of the sorted weights.
+    """
+
+    valid = ~np.isnan(values) & ~np.isnan(weights)
+    weights = np.where(valid, weights, 0.)
+
+    order = np.argsort(np.where(valid, values, np.nan), axis=0)
+    sorted_values = np.take_along_axis(values, order, axis=0)
+    sorted_weights = np.take_along_axis(weights, order, axis=0)
+    cumulative_weights = np.cumsum(sorted_weights, axis=0)
+
+    return sorted_values, sorted_weights, cumulative_weights
+
+
+def weighted_quantiles_sorted(sorted_values, cumulative_weights, quantiles):
+
+    """
+    Weighted quantiles of each column from the output of sort_with_weights. Each value sits at the
+    midpoint of its weight on the cumulative weight axis, rescaled so that the smallest value is at
+    0 and the largest at 1, and the quantiles are interpolated linearly between these positions.
+    With equal weights this is the same as np.percentile. Returns an array of quantiles x columns.
+    """
+
+    sorted_weights = np.diff(cumulative_weights, axis=0, prepend=0.)
+    positive = sorted_weights > 0
+    total = cumulative_weights[-1]
+
+    midpoints = cumulative_weights - sorted_weights / 2
+    search_midpoints = np.where(positive, midpoints, -np.inf)
+
+    # values without weight are skipped - the last row with weight at or before each row
+    rows = np.arange(sorted_values.shape[0])[:, np.newaxis]
+    previous = np.maximum.accumulate(np.where(positive, rows, 0), axis=0)
+
+    first = np.argmax(positive, axis=0)[np.newaxis, :]
+    last = previous[-1:]
+    lowest = np.take_along_axis(midpoints, first, axis=0)[0]
+    highest = np.take_along_axis(midpoints, last, axis=0)[0]
+
+    results = np.full((len(quantiles), sorted_values.shape[1]), np.nan)
+
+    for i, quantile in enumerate(quantiles):
+        target = lowest + quantile * (highest - lowest)
+
+        # first value at or above the target, and the value before it
+        above = search_midpoints >= target[np.newaxis, :]
+        upper = np.where(np.any(above, axis=0), np.argmax(above, axis=0), last[0])[np.newaxis, :]
+        lower = np.where(upper > first, np.take_along_axis(previous, np.maximum(upper - 1, 0), axis=0), upper)
+
+        lower_midpoint = np.take_along_axis(midpoints, lower, axis=0)[0]
+        upper_midpoint = np.take_along_axis(midpoints, upper, axis=0)[0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.clip((target - lower_midpoint) / (upper_midpoint - lower_midpoint), 0, 1)
+        fraction = np.where(upper_midpoint > lower_midpoint, fraction, 0.)
+
+        lower_value = np.take_along_axis(sorted_values, lower, axis=0)[0]
+        upper_value = np.take_along_axis(sorted_values, upper, axis=0)[0]
+        results[i] = lower_value + fraction * (upper_value - lower_value)
+
+    results[:, total <= 0] = np.nan
+
+    return results
+
+
+def calculate_inequality(values, weights, quantile_ratios=default_quantile_ratios):
+
+    """
+    Gini, Theil, coefficient of variation and interquantile ratios of each column of a 2D array
+    with the given weights (np.ones for unweighted). Returns a dict of name -> 1D array.
+    """
+
+    sorted_values, sorted_weights, cumulative_weights = sort_with_weights(values, weights)
+    filled_values = np.where(sorted_weights > 0, sorted_values, 0.)
+
+    total_weight = cumulative_weights[-1]
+    weighted_values = sorted_weights * filled_values
+    cumulative_values = np.cumsum(weighted_values, axis=0)
+    total_value = cumulative_values[-1]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+
+        mean = total_value / total_weight
+
+        # area under the Lorenz curve, by trapezoids: sum w_i * (S_i + S_i-1) / (W * S)
+        previous_values = np.vstack([np.zeros((1, values.shape[1])), cumulative_values[:-1]])
+        lorenz_area = np.sum(sorted_weights * (cumulative_values + previous_values), axis=0)
+        gini = 1 - lorenz_area / (total_weight * total_value)
+
+        variance = np.sum(sorted_weights * (filled_values - mean) ** 2, axis=0) / total_weight
+        cv = np.sqrt(variance) / mean
+
+        # Theil T - only defined for positive values; zeros contribute nothing (x ln x -> 0)
+        ratio = filled_values / mean
+        theil_terms = np.where(ratio > 0, ratio * np.log(np.where(ratio > 0, ratio, 1.)), 0.)
+        theil = np.sum(sorted_weights * theil_terms, axis=0) / total_weight
+
+    # negative values (e.g. net sinks) make Gini and Theil meaningless
+    has_negative = np.any((sorted_weights > 0) & (sorted_values < 0), axis=0)
+    gini[has_negative] = np.nan
+    theil[has_negative] = np.nan
+
+    metrics = {'gini': gini, 'theil': theil, 'cv': cv}
+
+    quantiles = sorted(set([quantile for pair in quantile_ratios for quantile in pair]))
+    quantile_values = dict(zip(quantiles, weighted_quantiles_sorted(sorted_values, cumulative_weights, quantiles)))
+    for upper, lower in quantile_ratios:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            metrics['p{:g}_p{:g}'.format(100 * upper, 100 * lower)] = quantile_values[upper] / quantile_values[lower]
+
+    return metrics
+
+
+@instrument
+def calculate_convergence_metrics(df, df_population=None, quantile_ratios=default_quantile_ratios):
+
+    """
+    Inequality and dispersion across countries of an indicator (countries x years, e.g. per capita
+    emissions) in every year: Gini, Theil, coefficient of variation and interquantile ratios (e.g.
+    'p90_p10'). If df_population is given, the population-weighted metrics are added with the
+    suffix '_weighted' (only countries and years in both dataframes are used).
+    Falling values over time indicate that countries are converging. Returns a dataframe with
+    the years as index, which can be plotted directly.
+    """
+
+    if df_population is not None:
+        df, df_population = align_datasets([df, df_population])
+
+    values = df.values.astype(float)
+
+    metrics = calculate_inequality(values, np.ones(values.shape), quantile_ratios=quantile_ratios)
+    metrics['n_countries'] = np.sum(~np.isnan(values), axis=0)
+
+    if df_population is not None:
+        weighted_metrics = calculate_inequality(values, df_population.values.astype(float),
+                                                quantile_ratios=quantile_ratios)
+        metrics.update({name + '_weighted': metric for name, metric in weighted_metrics.items()})
+
+    return pd.DataFrame(metrics, index=pd.Index(list(df.columns), name='year'))
@@ -0,0 +1,133 @@
+# Project and Title: Global Stocktake Toolkit - country code lookup tables
+
+# Purpose: Translate between ISO2 codes, ISO3 codes and country names.
+# The country code file is read only once and kept as dicts so that whole
+# columns of data can be converted with a single vectorised map.
+
+# =====================================================
+
+import os
+from functools import lru_cache
+
+import pandas as pd
+
+# ======================
+
+country_code_file = os.path.join(os.path.dirname(__file__), 'country_codes.csv')
+
+code_types = ['ISO2', 'ISO3', 'name', 'short_name']
+
+
+@lru_cache(maxsize=None)
+def get_country_code_tables():
+
+    """
+    Reads the country code file (once) and builds a lookup dict for each pair of code types,
+    e.g. tables[('ISO2', 'ISO3')]['DE'] = 'DEU'.
+    Short names are those used for the plots (shortcountrynames), falling back on the
+    name in the country code file where no short name is available.
+    """
+
+    # imported here rather than at the top so that importing gst_tools stays quick
+    import shortcountrynames
+
+    # keep_default_na is needed, otherwise Namibia ('NA') is read as a missing value
+    country_codes = pd.read_csv(country_code_file, dtype=str, keep_default_na=False)
+
+    short_names = shortcountrynames.names
+    country_codes['short_name'] = [short_names.get(iso3, name) for iso3, name
+                                   in zip(country_codes['ISO3'], country_codes['name'])]
+
+    tables = {}
+    for from_code in code_types:
+        for to_code in code_types:
+            if from_code == to_code:
+                continue
+            pairs = country_codes.loc[(country_codes[from_code] != '') & (country_codes[to_code] != ''),
+                                      [from_code, to_code]]
+            tables[(from_code, to_code)] = dict(zip(pairs[from_code], pairs[to_code]))
+
+    return tables
+
+
+def translate_country_codes(codes, from_code='ISO2', to_code='ISO3', keep_unknown=False, report_unknown=True):
+
+    """
+    Converts a list, array or Series of country codes (or names) from one type to another.
+    Valid types are 'ISO2', 'ISO3', 'name' and 'short_name'.
+    Unknown codes are set to NaN, or kept as they are if keep_unknown is True (useful for
+    plot labels). If report_unknown is True, the unknown codes are listed for the user.
+    Returns a Series with the same index as the input (if the input is a Series).
+    """
+
+    if (from_code not in code_types) or (to_code not in code_types):
+        print('Code types must be one of ' + str(code_types) + '. Please try again.')
+        return
+
+    table = get_country_code_tables()[(from_code, to_code)]
+
+    codes = pd.Series(codes) if not isinstance(codes, pd.Series) else codes
+    translated = codes.map(table)
+
+    unknown = codes.loc[translated.isnull() & codes.notnull()]
+    if report_unknown and len(unknown) > 0:
+        print('The following ' + from_code + ' codes could not be converted to ' + to_code + ':')
+        print(sorted(unknown.unique()))
+
+    if keep_unknown:
+        translated = translated.where(translated.notnull(), codes)
+
+    return translated
+
+
+def find_unknown_codes(codes, code_type='ISO3'):
+
+    """
+    Returns a sorted list of all the codes that are not recognised as the given code type.
+    """
+
+    if code_type == 'ISO3':
+        known = get_country_code_tables()[('ISO3', 'ISO2')]
+    else:
+        known = get_country_code_tables()[(code_type, 'ISO3')]
+
+    unknown = set(pd.Series(codes).dropna().unique()) - set(known)
+
+    return sorted(unknown)
+
+
+def convert_ISO2_to_ISO3(codes):
+
+    """
+    convert country 2-letter ISO codes to 3-letter ISO codes.
+    """
+
+    return translate_country_codes(codes, from_code='ISO2', to_code='ISO3')
+
+
+def convert_ISO3_to_ISO2(codes):
+
+    """
+    convert country 3-letter ISO codes to 2-letter ISO codes.
+    """
+
+    return translate_country_codes(codes, from_code='ISO3', to_code='ISO2')
+
+
+def convert_ISO3_to_name(codes):
+
+    """
+    convert 3-letter ISO codes to full country names
+    """
+
+    return translate_country_codes(codes, from_code='ISO3', to_code='name')
+
+
+def convert_to_short_names(codes, from_code='ISO3'):
+
+    """
+    convert ISO codes to short country names for plotting. Unknown codes (e.g. regions) are kept as they are.
+    """
+
+    return translate_country_codes(codes, from_code=from_code, to_code='short_name',
+                                   keep_unknown=True, report_unknown=False)
@@ -0,0 +1,229 @@
+# Project and Title: Global Stocktake Toolkit - country name matching
+
+# Purpose: Convert country names in raw data (e.g. EIA, UNFCCC) to ISO3 codes.
+# Names are matched exactly, via a table of known aliases, or by fuzzy matching.
+# Resolved names are stored in a cache file (input-data/country-name-cache.json in
+# the repository, wherever the code is run from) so that repeat runs don't need to
+# match again. Fuzzy matches are only stored once they have been checked.
+
+# =====================================================
+
+import os
+import re
+import json
+import difflib
+import unicodedata
+from functools import lru_cache
+
+import pandas as pd
+
+from .country_codes import country_code_file
+
+# ======================
+
+default_cache_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  'input-data', 'country-name-cache.json')
+
+# alternative names found in the raw data sources, all written in normalised form (see normalise_name)
+name_aliases = {
+    'eu': 'EU28',
+    'eu28': 'EU28',
+    'european union': 'EU28',
+    'european union 28': 'EU28',
+    'eu15': 'EU15',
+    'european union 15': 'EU15',
+    'bolivia plurinational state of': 'BOL',
+    'bolivia the plurinational state of': 'BOL',
+    'congo democratic republic of the': 'COD',
+    'democratic republic of the congo': 'COD',
+    'congo kinshasa': 'COD',
+    'congo brazzaville': 'COG',
+    'cote divoire': 'CIV',
+    'ivory coast': 'CIV',
+    'czech republic': 'CZE',
+    'gambia the': 'GMB',
+    'bahamas the': 'BHS',
+    'iran islamic republic of': 'IRN',
+    'korea republic of': 'KOR',
+    'south korea': 'KOR',
+    'korea south': 'KOR',
+    'korea democratic peoples republic of': 'PRK',
+    'north korea': 'PRK',
+    'korea north': 'PRK',
+    'lao peoples democratic republic': 'LAO',
+    'laos': 'LAO',
+    'micronesia federated states of': 'FSM',
+    'moldova republic of': 'MDA',
+    'republic of moldova': 'MDA',
+    'macedonia': 'MKD',
+    'former yugoslav republic of macedonia': 'MKD',
+    'north macedonia': 'MKD',
+    'russia': 'RUS',
+    'russian federation': 'RUS',
+    'syrian arab republic': 'SYR',
+    'tanzania united republic of': 'TZA',
+    'united republic of tanzania': 'TZA',
+    'united kingdom of great britain and northern ireland': 'GBR',
+    'uk': 'GBR',
+    'united states of america': 'USA',
+    'united states': 'USA',
+    'us': 'USA',
+    'venezuela bolivarian republic of': 'VEN',
+    'viet nam': 'VNM',
+    'burma': 'MMR',
+    'swaziland': 'SWZ',
+    'eswatini': 'SWZ',
+    'cabo verde': 'CPV',
+    'cape verde': 'CPV',
+    'timor leste': 'TLS',
+    'east timor': 'TLS',
+}
+
+
+def normalise_name(name):
+
+    """
+    Makes a country name comparable across sources: lower case, no accents, '&' written
+    as 'and', no punctuation, no leading 'the' and single spaces only.
+    """
+
+    name = unicodedata.normalize('NFKD', str(name))
+    name = ''.join(char for char in name if not unicodedata.combining(char))
+    name = name.lower().replace('&', ' and ')
+    name = re.sub(r"[\.'`]", '', name)
+    name = re.sub(r'[^a-z0-9]+', ' ', name).strip()
+    name = re.sub(r'^the ', '', name)
+
+    return name
+
+
+@lru_cache(maxsize=None)
+def get_name_lookup():
+
+    """
+    Builds (once) a dict of normalised country name -> ISO3 code from the country code file,
+    the short country names used for plotting and the alias table above.
+    """
+
+    import shortcountrynames
+
+    country_codes = pd.read_csv(country_code_file, dtype=str, keep_default_na=False)
+
+    lookup = {}
+
+    # IEA names include regions such as 'Other Asia', so only keep those that point to one country
+    iea_names = country_codes.loc[country_codes['IEA_Name'] != '', ['IEA_Name', 'ISO3']]
+    iea_names = iea_names.drop_duplicates(subset='IEA_Name', keep=False)
+    lookup.update({normalise_name(name): iso3 for name, iso3 in zip(iea_names['IEA_Name'], iea_names['ISO3'])})
+
+    lookup.update({normalise_name(name): iso3 for name, iso3 in zip(country_codes['name'], country_codes['ISO3'])})
+
+    lookup.update({normalise_name(name): code for code, name in shortcountrynames.names.items()
+                   if len(code) == 3})
+
+    # the codes themselves are also valid
+    lookup.update({normalise_name(iso3): iso3 for iso3 in country_codes['ISO3']})
+
+    lookup.update(name_aliases)
+
+    return lookup
+
+
+def load_name_cache(cache_file=default_cache_file):
+
+    """
+    Reads previously resolved names (raw name -> ISO3) from the cache file.
+    """
+
+    if cache_file and os.path.exists(cache_file):
+        with open(cache_file, 'r') as f:
+            return json.load(f)
+
+    return {}
+
+
+def save_name_cache(cache, cache_file=default_cache_file):
+
+    """
+    Writes resolved names (raw name -> ISO3) to the cache file.
+    """
+
+    cache_folder = os.path.dirname(cache_file)
+    if cache_folder and not os.path.exists(cache_folder):
+        os.makedirs(cache_folder)
+
+    with open(cache_file, 'w') as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+
+
+def match_name(name, fuzzy_cutoff=0.85):
+
+    """
+    Finds the ISO3 code for a single country name. Tries an exact match of the normalised name
+    (which includes the aliases) first, then a fuzzy match. Returns the code and the method used
+    ('exact', 'fuzzy'), or (None, None) if no match was found.
+    """
+
+    lookup = get_name_lookup()
+    key = normalise_name(name)
+
+    if key in lookup:
+        return lookup[key], 'exact'
+
+    if fuzzy_cutoff:
+        close_matches = difflib.get_close_matches(key, list(lookup), n=1, cutoff=fuzzy_cutoff)
+        if close_matches:
+            return lookup[close_matches[0]], 'fuzzy'
+
+    return None, None
+
+
+def convert_names_to_ISO3(names, cache_file=default_cache_file, fuzzy_cutoff=0.85, cache_fuzzy=False,
+                          verbose=True):
+
+    """
+    Converts a list, array or Series of country names to ISO3 codes.
+    Each unique name is only matched once - names already in the cache file are looked up
+    directly and newly resolved names are added to the cache. Set cache_file to None to not
+    use a cache. Names that could not be matched are set to NaN and listed for the user, as
+    are the fuzzy matches (which are worth checking!). The fuzzy matches are used, but only
+    added to the cache if cache_fuzzy is True - i.e. once they have been checked.
+    Returns a Series with the same index as the input (if the input is a Series).
+    """
+
+    names = pd.Series(names) if not isinstance(names, pd.Series) else names
+
+    cache = load_name_cache(cache_file)
+
+    new_matches = {}
+    fuzzy_matches = {}
+    unmatched = []
+    for name in names.dropna().unique():
+        if name in cache:
+            continue
+        iso3, method = match_name(name, fuzzy_cutoff=fuzzy_cutoff)
+        if iso3 is None:
+            unmatched.append(name)
+            continue
+        new_matches[name] = iso3
+        if method == 'fuzzy':
+            fuzzy_matches[name] = iso3
+
+    if verbose:
+        if fuzzy_matches:
+            print('The following names were matched approximately, please check '
+                  '(and rerun with cache_fuzzy=True to keep them):')
+            for name in sorted(fuzzy_matches):
+                print('   ' + name + ' -> ' + fuzzy_matches[name])
+        if unmatched:
+            print('The following names could not be matched to an ISO3 code:')
+            print(sorted(unmatched))
+
+    # only write the cache if something new was resolved (unchecked fuzzy matches aren't kept)
+    if not cache_fuzzy:
+        new_matches = {name: iso3 for name, iso3 in new_matches.items() if name not in fuzzy_matches}
+    cache.update(new_matches)
+    if cache_file and new_matches:
+        save_name_cache(cache, cache_file)
+
+    return names.map(dict(cache, **fuzzy_matches))
@@ -0,0 +1,171 @@
+# Project and Title: Global Stocktake Toolkit - cumulative emissions and budgets
+
+# Purpose: Cumulative emissions since one or more start years, per capita cumulative
+# emissions, remaining budgets and the year in which a cumulative threshold is first
+# exceeded - for all countries and years at once. The cumulative sum over the years is
+# calculated once (a prefix sum) and the total since any start year up to any year is
+# the difference of two of its columns.
+# All results are dataframes with countries as index and years as columns (or a value
+# per country), so any year can be passed straight to make_histogram.
+
+# =====================================================
+
+import pandas as pd
+import numpy as np
+
+from .gst_utils import align_datasets
+from .instrumentation import instrument
+
+# ======================
+
+
+def prefix_sums(values):
+
+    """
+    Cumulative sums of the values (NaN counted as 0) and of the number of missing values along
+    the years (axis 1), each with a leading column of zeros - so that the sum over years i to j
+    (inclusive) is sums[:, j + 1] - sums[:, i].
+    """
+
+    missing = np.isnan(values)
+    zeros = np.zeros((values.shape[0], 1))
+
+    sums = np.concatenate([zeros, np.cumsum(np.where(missing, 0., values), axis=1)], axis=1)
+    missing_counts = np.concatenate([zeros, np.cumsum(missing, axis=1)], axis=1)
+
+    return sums, missing_counts
+
+
+def cumulative_cube(values, start_positions, allow_gaps=False):
+
+    """
+    Cumulative totals (start years x countries x years) from each start position to every year,
+    as a broadcast difference of prefix sums. Years before the start are NaN, and so are totals
+    over a period with missing data unless allow_gaps is True (missing years are then counted as 0).
+    """
+
+    sums, missing_counts = prefix_sums(values)
+    start_positions = np.asarray(start_positions)
+
+    # start years x countries x years
+    totals = sums[np.newaxis, :, 1:] - sums[:, start_positions].T[:, :, np.newaxis]
+    missing = missing_counts[np.newaxis, :, 1:] - missing_counts[:, start_positions].T[:, :, np.newaxis]
+
+    before_start = np.arange(values.shape[1])[np.newaxis, :] < start_positions[:, np.newaxis]
+    totals[np.broadcast_to(before_start[:, np.newaxis, :], totals.shape)] = np.nan
+    if not allow_gaps:
+        totals[missing > 0] = np.nan
+
+    return totals
+
+
+def get_start_positions(columns, start_years):
+
+    """
+    Positions of the start years among the year columns, or None (and a message for the user)
+    if any of them is not available.
+    """
+
+    years = [str(year) for year in columns]
+    missing_years = [year for year in start_years if str(year) not in years]
+    if missing_years:
+        print('The start years ' + str(missing_years) + ' are not available, please try again.')
+        return
+
+    return [years.index(str(year)) for year in start_years]
+
+
+@instrument
+def calculate_cumulative_since(df, start_years, allow_gaps=False):
+
+    """
+    Cumulative totals (e.g. emissions) since each of the start years, up to and including every
+    year, for all countries. Totals over periods with missing data are NaN unless allow_gaps
+    is True. Returns a dict of start year -> dataframe (countries x years).
+    """
+
+    start_positions = get_start_positions(df.columns, start_years)
+    if start_positions is None:
+        return
+
+    totals = cumulative_cube(df.values.astype(float), start_positions, allow_gaps=allow_gaps)
+
+    return {year: pd.DataFrame(totals[i], index=df.index, columns=df.columns)
+            for i, year in enumerate(start_years)}
+
+
+@instrument
+def calculate_cumulative_per_capita(df_emissions, df_population, start_years, method='sum_per_capita',
+                                    allow_gaps=False):
+
+    """
+    Per capita cumulative emissions since each of the start years, for all countries and years.
+    Only countries and years in both dataframes are used. Methods:
+        'sum_per_capita' - sum of the annual per capita emissions (each year with its own population)
+        'current_population' - cumulative emissions divided by the population of each year
+    Returns a dict of start year -> dataframe (countries x years).
+    """
+
+    df_emissions, df_population = align_datasets([df_emissions, df_population])
+    emissions = df_emissions.values.astype(float)
+    population = df_population.values.astype(float)
+
+    start_positions = get_start_positions(df_emissions.columns, start_years)
+    if start_positions is None:
+        return
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if method == 'sum_per_capita':
+            per_capita = np.where(population > 0, emissions / population, np.nan)
+            totals = cumulative_cube(per_capita, start_positions, allow_gaps=allow_gaps)
+        elif method == 'current_population':
+            totals = cumulative_cube(emissions, start_positions, allow_gaps=allow_gaps)
+            totals = np.where(population > 0, totals / population[np.newaxis, :, :], np.nan)
+        else:
+            print('Method must be sum_per_capita or current_population. Please try again.')
+            return
+
+    return {year: pd.DataFrame(totals[i], index=df_emissions.index, columns=df_emissions.columns)
+            for i, year in enumerate(start_years)}
+
+
+def calculate_remaining_budget(df_cumulative, budget):
+
+    """
+    Budget left after the cumulative emissions (countries x years) in each year. 'budget' is one
+    value for all countries or a series with a value per country. Negative values mean the budget
+    has been exceeded.
+    """
+
+    if isinstance(budget, pd.Series):
+        return df_cumulative.rsub(budget.reindex(df_cumulative.index), axis=0)
+
+    return budget - df_cumulative
+
+
+@instrument
+def calculate_threshold_year(df_cumulative, thresholds):
+
+    """
+    First year in which the cumulative value (countries x years) exceeds each threshold. 'thresholds'
+    is a list of values for all countries, or a dict of name -> series with a value per country
+    (e.g. national budgets). Countries that haven't exceeded a threshold get NaN.
+    Returns a dataframe with countries as index and a column per threshold.
+    """
+
+    values = df_cumulative.values.astype(float)
+    years = np.array(list(map(int, df_cumulative.columns)), dtype=float)
+
+    if isinstance(thresholds, dict):
+        names = list(thresholds)
+        limits = np.stack([thresholds[name].reindex(df_cumulative.index).values.astype(float) for name in names])
+    else:
+        names = list(thresholds)
+        limits = np.repeat(np.asarray(thresholds, dtype=float)[:, np.newaxis], values.shape[0], axis=1)
+
+    # thresholds x countries x years
+    with np.errstate(invalid='ignore'):
+        exceeded = values[np.newaxis, :, :] > limits[:, :, np.newaxis]
+    first_year = np.where(exceeded.any(axis=2), years[np.argmax(exceeded, axis=2)], np.nan)
+
+    return pd.DataFrame(first_year.T, index=df_cumulative.index, columns=names)
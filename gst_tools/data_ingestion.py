@@ -0,0 +1,136 @@
+# Project and Title: Global Stocktake Toolkit - raw data reading
+
+# Purpose: Read large raw datasets (PRIMAP-hist, UNFCCC, ...) using as little memory as
+# possible. Metadata columns are read as categoricals (each string is stored once
+# rather than on every row) and the values as float32 unless float64 is requested.
+# Several files can also be read at the same time (read_datasets).
+
+# =====================================================
+
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+from .instrumentation import instrument
+
+# ======================
+
+# metadata columns found in the raw and processed data files - all read as categoricals
+metadata_columns = ['sectorCode', 'sector', 'unit', 'ISO', 'countries', 'entity', 'scenario',
+                    'category', 'country', 'source', 'variable', 'code', 'classification']
+
+# years can be labelled NNNN or YNNNN
+year_column_pattern = r"Y?[0-9]{4}$"
+
+
+def get_raw_data_schema(columns, value_dtype='float32'):
+
+    """
+    Declares the dtype of each column: categoricals for the metadata and value_dtype for the years.
+    Empty columns (e.g. 'Unnamed: 34', which comes from a trailing comma on every line) are
+    left out and so are never parsed. Returns the columns to read and the dtypes.
+    """
+
+    dtypes = {}
+    for column in columns:
+        if column.startswith('Unnamed:'):
+            continue
+        if re.match(year_column_pattern, column) is not None:
+            dtypes[column] = value_dtype
+        else:
+            # anything unknown is also metadata, so also a categorical
+            dtypes[column] = 'category'
+
+    return list(dtypes), dtypes
+
+
+def estimate_plain_memory(df):
+
+    """
+    Estimates how much memory (bytes) the dataframe would use if it had been read with a plain
+    pd.read_csv, i.e. with object strings on every row and float64 values.
+    """
+
+    memory = df.index.memory_usage(deep=True)
+
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            categories = df[column].cat.categories
+            string_sizes = np.array([sys.getsizeof(category) for category in categories])
+            counts = np.bincount(df[column].cat.codes[df[column].cat.codes >= 0], minlength=len(categories))
+            # each row holds a pointer (8 bytes) to its own string
+            memory += 8 * len(df) + int((string_sizes * counts).sum())
+        else:
+            memory += 8 * len(df)
+
+    return memory
+
+
+@instrument
+def read_raw_data(filename, value_dtype='float32', rename_years=True, verbose=True):
+
+    """
+    Reads a raw data file (csv) with categorical metadata and float32 values (float64 if
+    value_dtype='float64' - float32 keeps ~7 significant digits, which is more than the raw
+    datasets are published with). Empty 'Unnamed' columns are dropped when parsing and, if
+    rename_years is True, years labelled YNNNN are renamed to NNNN.
+    The memory used and saved compared to a plain read is reported to the user.
+    """
+
+    header = pd.read_csv(filename, nrows=0)
+    columns, dtypes = get_raw_data_schema(list(header.columns), value_dtype=value_dtype)
+
+    data = pd.read_csv(filename, usecols=columns, dtype=dtypes)
+
+    # make sure the columns are in the order of the file
+    data = data[columns]
+
+    if rename_years:
+        data = data.rename(columns={column: column[1:] for column in columns
+                                    if column.startswith('Y') and re.match(year_column_pattern, column)})
+
+    if verbose:
+        lean_memory = data.memory_usage(deep=True).sum()
+        plain_memory = estimate_plain_memory(data)
+        print('Read ' + filename + ': {:.1f} MB in memory (plain read ~{:.1f} MB, {:.0f}% saved)'.format(
+              lean_memory / 1e6, plain_memory / 1e6, 100 * (1 - lean_memory / plain_memory)))
+
+    return data
+
+
+def read_and_validate(filename, reader, validate):
+
+    data = reader(filename)
+
+    if (validate is not None) and not validate(data):
+        print('WARNING: ' + filename + ' is not correctly formatted! Please check before continuing!')
+
+    return data
+
+
+@instrument
+def read_datasets(filenames, reader=pd.read_csv, validate=None, max_workers=4, return_futures=False):
+
+    """
+    Reads several datasets at the same time on a pool of threads, so that waiting for the disk
+    (or a network share) overlaps with parsing. 'reader' is the function used to read each file
+    (e.g. pd.read_csv or read_raw_data) and 'validate' an optional check run on each dataset
+    as soon as it has been read (e.g. gst_utils.verify_data_format).
+    Returns a dict of filename -> dataframe in the order the files were given or, if
+    return_futures is True, a dict of filename -> future straight away, so that the calculation
+    can start before all the files are read (use future.result() to get each dataframe).
+    """
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {filename: executor.submit(read_and_validate, filename, reader, validate) for filename in filenames}
+
+    # the threads keep running until all files are read, but don't block here
+    executor.shutdown(wait=False)
+
+    if return_futures:
+        return futures
+
+    return {filename: future.result() for filename, future in futures.items()}
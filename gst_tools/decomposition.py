@@ -0,0 +1,140 @@
+# Project and Title: Global Stocktake Toolkit - Kaya decomposition
+
+# Purpose: Kaya-style index decomposition of the change in emissions into the
+# contributions of population, GDP per capita and emissions intensity of GDP:
+#     E = P * (G / P) * (E / G)
+# using the logarithmic mean Divisia index (LMDI-I, additive and multiplicative).
+# All countries and all (start year, end year) periods are calculated at once.
+
+# =====================================================
+
+import pandas as pd
+import numpy as np
+
+from .gst_utils import align_datasets
+from .instrumentation import instrument
+
+# ======================
+
+kaya_factors = ['population', 'gdp_per_capita', 'emissions_intensity']
+
+
+def log_mean(a, b):
+
+    """
+    Logarithmic mean L(a, b) = (a - b) / (ln a - ln b), with L(a, a) = a. NaN unless both are positive.
+    """
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (a - b) / (np.log(a) - np.log(b))
+    mean = np.where(np.isclose(a, b), a, mean)
+    mean = np.where((a > 0) & (b > 0), mean, np.nan)
+
+    return mean
+
+
+@instrument
+def calculate_kaya_decomposition(df_emissions, df_population, df_gdp, periods, relative=False):
+
+    """
+    Decomposes the change in emissions over each (start year, end year) period in 'periods' into
+    the contributions of population, GDP per capita and emissions intensity (emissions / GDP).
+    The three dataframes must have countries as index and years as columns; only countries and
+    years in all three are used.
+
+    Returns two dicts of dataframes (countries x periods, periods labelled 'start-end'):
+        additive - contribution of each factor to the change in emissions (in the unit of the
+                   emissions, or in % of the start year emissions if relative is True) and the
+                   total change ('total'). The factors add up exactly to the total.
+        multiplicative - ratio of the end to the start value due to each factor, and the total
+                         ratio. The factors multiply to the total.
+    Countries with missing, zero or negative values in a period get NaN for that period.
+    """
+
+    emissions, population, gdp = align_datasets([df_emissions, df_population, df_gdp])
+    countries = emissions.index
+    years = [str(year) for year in emissions.columns]
+
+    missing_years = sorted(set(str(year) for period in periods for year in period) - set(years), key=int)
+    if missing_years:
+        print('The years ' + str(missing_years) + ' of the periods are not available in all three datasets, '
+              'please try again.')
+        return
+
+    start_positions = [years.index(str(start)) for start, end in periods]
+    end_positions = [years.index(str(end)) for start, end in periods]
+    period_labels = [str(start) + '-' + str(end) for start, end in periods]
+
+    emissions = emissions.values.astype(float)
+    population = population.values.astype(float)
+    gdp = gdp.values.astype(float)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        factors = {
+            'population': population,
+            'gdp_per_capita': gdp / population,
+            'emissions_intensity': emissions / gdp,
+        }
+
+    # countries x periods
+    emissions_start = emissions[:, start_positions]
+    emissions_end = emissions[:, end_positions]
+    weight = log_mean(emissions_end, emissions_start)
+
+    additive = {}
+    multiplicative = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for name in kaya_factors:
+            log_ratio = np.log(factors[name][:, end_positions] / factors[name][:, start_positions])
+            contribution = weight * log_ratio
+            if relative:
+                contribution = 100 * contribution / emissions_start
+            additive[name] = contribution
+            multiplicative[name] = np.exp(log_ratio)
+
+        total = emissions_end - emissions_start
+        if relative:
+            total = 100 * total / emissions_start
+        additive['total'] = total
+        multiplicative['total'] = emissions_end / emissions_start
+
+    # a country-period is only decomposed if every factor is, so that the factors always add up
+    # (or multiply) to the total
+    valid = np.isfinite(weight)
+    for name in kaya_factors:
+        valid &= np.isfinite(additive[name]) & np.isfinite(multiplicative[name])
+    for name in kaya_factors + ['total']:
+        additive[name] = np.where(valid, additive[name], np.nan)
+        multiplicative[name] = np.where(valid, multiplicative[name], np.nan)
+
+    additive = {name: pd.DataFrame(array, index=countries, columns=period_labels)
+                for name, array in additive.items()}
+    multiplicative = {name: pd.DataFrame(array, index=countries, columns=period_labels)
+                      for name, array in multiplicative.items()}
+
+    return additive, multiplicative
+
+
+def plot_decomposition_histograms(additive, period, unit_, sourcename='unspecified',
+                                  remove_outliers=True, ktuk=3, save_plot=False, plot_name='kaya'):
+
+    """
+    Plots a histogram (make_histogram) of each factor's contribution, and of the total change,
+    across all countries for one period ('start-end') of the additive decomposition.
+    Countries with no result for the period are left out.
+    """
+
+    from .make_plots import make_histogram
+
+    titles = {
+        'population': 'contribution of population to the change in emissions, ',
+        'gdp_per_capita': 'contribution of GDP per capita to the change in emissions, ',
+        'emissions_intensity': 'contribution of emissions intensity to the change in emissions, ',
+        'total': 'change in emissions, ',
+    }
+
+    for name in kaya_factors + ['total']:
+        make_histogram(additive[name][period].dropna(), unit_,
+                       xlabel=name.replace('_', ' ') + ' (' + unit_ + ')', title=titles[name] + period,
+                       sourcename=sourcename, remove_outliers=remove_outliers, ktuk=ktuk,
+                       save_plot=save_plot, plot_name=(plot_name + '-' + name + '-' + period))
@@ -0,0 +1,154 @@
+# Project and Title: Global Stocktake Toolkit - decoupling classification
+
+# Purpose: Decoupling of one variable (e.g. emissions) from another (e.g. GDP).
+# The elasticity (% change of the response / % change of the driver) is calculated
+# over rolling windows for all countries, and each country and window is classified
+# into the eight Tapio decoupling categories (Tapio, 2005, Transport Policy 12).
+# The categories are stored as int8 codes in a cube (windows x countries x years).
+
+# =====================================================
+
+import pandas as pd
+import numpy as np
+
+from .gst_utils import align_datasets
+from .instrumentation import instrument
+
+# ======================
+
+# codes of the categories in the cube; -1 means the country / window can't be classified
+decoupling_categories = [
+    'strong decoupling',
+    'weak decoupling',
+    'expansive coupling',
+    'expansive negative decoupling',
+    'strong negative decoupling',
+    'weak negative decoupling',
+    'recessive coupling',
+    'recessive decoupling',
+]
+not_classified = -1
+
+# elasticities between these bounds count as coupling
+coupling_bounds = (0.8, 1.2)
+
+
+def calculate_window_change(values, window):
+
+    """
+    % change between the first and last year of a rolling window (ending in each year) of
+    'window' years, for all rows of a 2D array (countries x years). Years without a full window,
+    and windows starting from a missing, zero or negative value, are NaN.
+    """
+
+    change = np.full(values.shape, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        start = values[:, :-window]
+        change[:, window:] = np.where(start > 0, 100 * (values[:, window:] / start - 1), np.nan)
+
+    return change
+
+
+def classify_decoupling(response_change, driver_change, elasticity, bounds=coupling_bounds):
+
+    """
+    Tapio decoupling category (int8 code, see decoupling_categories) from the % change of the
+    response, the % change of the driver and the elasticity. Arrays of any shape.
+    """
+
+    low, high = bounds
+    with np.errstate(invalid='ignore'):
+        growing = driver_change > 0
+        shrinking = driver_change < 0
+        conditions = [
+            growing & (response_change < 0),
+            growing & (response_change >= 0) & (elasticity < low),
+            growing & (response_change >= 0) & (elasticity >= low) & (elasticity <= high),
+            growing & (elasticity > high),
+            shrinking & (response_change > 0),
+            shrinking & (response_change <= 0) & (elasticity < low),
+            shrinking & (response_change <= 0) & (elasticity >= low) & (elasticity <= high),
+            shrinking & (response_change <= 0) & (elasticity > high),
+        ]
+
+    categories = np.select(conditions, np.arange(len(conditions)), default=not_classified).astype(np.int8)
+    categories[np.isnan(elasticity)] = not_classified
+
+    return categories
+
+
+@instrument
+def calculate_decoupling(df_response, df_driver, windows=(5, 10), bounds=coupling_bounds):
+
+    """
+    Elasticity of df_response with respect to df_driver (both countries x years, e.g. emissions and
+    GDP) over rolling windows of each length in 'windows' (in years, ending in each year) and the
+    Tapio decoupling category of each country, window and year. Only countries and years in both
+    dataframes are used.
+
+    Returns:
+        categories - int8 cube (windows x countries x years) of category codes; the names are in
+                     decoupling_categories and -1 is not classified (missing data, or no change
+                     in the driver)
+        elasticities - float cube of the same shape
+        coords - dict with the 'windows', 'countries' and 'years' along each axis of the cubes
+    """
+
+    response, driver = align_datasets([df_response, df_driver])
+    response_values = response.values.astype(float)
+    driver_values = driver.values.astype(float)
+
+    shape = (len(windows),) + response_values.shape
+    categories = np.full(shape, not_classified, dtype=np.int8)
+    elasticities = np.full(shape, np.nan)
+
+    for i, window in enumerate(windows):
+        response_change = calculate_window_change(response_values, window)
+        driver_change = calculate_window_change(driver_values, window)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            elasticity = response_change / driver_change
+        elasticity[~np.isfinite(elasticity)] = np.nan
+
+        elasticities[i] = elasticity
+        categories[i] = classify_decoupling(response_change, driver_change, elasticity, bounds=bounds)
+
+    coords = {'windows': list(windows), 'countries': list(response.index), 'years': list(response.columns)}
+
+    return categories, elasticities, coords
+
+
+def count_decoupling_categories(categories, coords, window):
+
+    """
+    Number of countries in each decoupling category in each year, for one of the windows in
+    the cube. Returns a dataframe with years as index and categories as columns.
+    """
+
+    category_slice = categories[coords['windows'].index(window)]
+
+    # one bincount over all years: offset each year's codes so they don't overlap
+    n_codes = len(decoupling_categories) + 1
+    n_years = category_slice.shape[1]
+    offset_codes = (category_slice.astype(int) + 1) + n_codes * np.arange(n_years)[np.newaxis, :]
+    counts = np.bincount(offset_codes.ravel(), minlength=n_codes * n_years).reshape(n_years, n_codes)
+
+    counts = pd.DataFrame(counts, index=pd.Index(coords['years'], name='year'),
+                          columns=['not classified'] + decoupling_categories)
+
+    return counts
+
+
+def get_decoupling_summary(counts, year, include_not_classified=False):
+
+    """
+    Category counts for one year in the format used by make_plots.peaking_barplot
+    (columns 'category' and 'count').
+    """
+
+    year_counts = counts.loc[year]
+    if not include_not_classified:
+        year_counts = year_counts.drop('not classified')
+
+    summary_data = pd.DataFrame({'category': year_counts.index, 'count': year_counts.values})
+
+    return summary_data
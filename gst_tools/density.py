@@ -0,0 +1,112 @@
+# Project and Title: Global Stocktake Toolkit - kernel density estimates
+
+# Purpose: Kernel density estimates of the distribution across countries for many years
+# at once, for the ridge and overlapping density plots in make_plots. The values of all
+# years are linearly binned onto one shared grid and convolved with a Gaussian kernel
+# (with each year's own bandwidth) by FFT, so the cost barely depends on the number of
+# countries and all years are done in a single transform.
+
+# =====================================================
+
+import pandas as pd
+import numpy as np
+
+from .instrumentation import instrument
+
+# ======================
+
+
+def get_bandwidths(values, method='scott'):
+
+    """
+    Gaussian kernel bandwidth of each column (year) of a 2D array (countries x years), ignoring NaNs.
+    'scott' and 'silverman' use the rules of thumb (as scipy / seaborn do); a number is used as is.
+    """
+
+    n_valid = np.sum(~np.isnan(values), axis=0)
+
+    if not isinstance(method, str):
+        return np.full(values.shape[1], float(method))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.nanstd(values, axis=0, ddof=1)
+        if method == 'scott':
+            factor = n_valid ** (-1 / 5)
+        elif method == 'silverman':
+            factor = (n_valid * 3 / 4) ** (-1 / 5)
+        else:
+            raise ValueError('bandwidth must be scott, silverman or a number')
+
+    return std * factor
+
+
+def linear_binning(values, grid):
+
+    """
+    Linear binning of each column of a 2D array (countries x years) onto an evenly spaced grid:
+    each value is split between the two nearest grid points. Values outside the grid and NaNs are
+    left out. Returns the (un-normalised) counts, years x grid points.
+    """
+
+    n_grid = len(grid)
+    n_years = values.shape[1]
+    step = grid[1] - grid[0]
+
+    valid = ~np.isnan(values) & (values >= grid[0]) & (values <= grid[-1])
+    position = (values[valid] - grid[0]) / step
+    lower = np.minimum(np.floor(position).astype(np.intp), n_grid - 2)
+    upper_weight = position - lower
+
+    # one bincount over all years: offset each year's grid points
+    year_offset = n_grid * np.nonzero(valid)[1]
+    counts = np.bincount(year_offset + lower, weights=1 - upper_weight, minlength=n_grid * n_years)
+    counts += np.bincount(year_offset + lower + 1, weights=upper_weight, minlength=n_grid * n_years)
+
+    return counts.reshape(n_years, n_grid)
+
+
+@instrument
+def calculate_kde(df, grid_size=512, bandwidth='scott', clip=None, cut=3):
+
+    """
+    Gaussian kernel density estimate of the distribution across countries (index) in every year
+    (columns) of a dataframe, all evaluated on one shared grid.
+    'bandwidth' is 'scott', 'silverman' or a number (in the unit of the data). Values outside
+    'clip' (min, max) are left out and the grid extends 'cut' bandwidths beyond the data, as in
+    seaborn's kdeplot. Each density integrates to 1 over the grid.
+    Returns the grid and the densities (dataframe, years x grid points).
+    """
+
+    values = df.values.astype(float)
+    if clip is not None:
+        with np.errstate(invalid='ignore'):
+            values = np.where((values >= clip[0]) & (values <= clip[1]), values, np.nan)
+
+    bandwidths = get_bandwidths(values, method=bandwidth)
+    max_bandwidth = np.nanmax(bandwidths)
+
+    grid_min = np.nanmin(values) - cut * max_bandwidth
+    grid_max = np.nanmax(values) + cut * max_bandwidth
+    if clip is not None:
+        grid_min = max(grid_min, clip[0])
+        grid_max = min(grid_max, clip[1])
+    grid = np.linspace(grid_min, grid_max, grid_size)
+    step = grid[1] - grid[0]
+
+    counts = linear_binning(values, grid)
+
+    # Gaussian kernel of each year on the grid spacing, convolved by FFT. Zero padding to twice
+    # the grid length stops the density wrapping around the ends.
+    n_fft = 2 * grid_size
+    offsets = step * np.fft.fftfreq(n_fft, d=1 / n_fft)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        kernels = np.exp(-0.5 * (offsets[np.newaxis, :] / bandwidths[:, np.newaxis]) ** 2)
+        kernels = kernels / (np.sqrt(2 * np.pi) * bandwidths[:, np.newaxis])
+
+    densities = np.fft.irfft(np.fft.rfft(counts, n=n_fft, axis=1) * np.fft.rfft(kernels, axis=1),
+                             n=n_fft, axis=1)[:, :grid_size]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        densities = np.maximum(densities, 0) / counts.sum(axis=1, keepdims=True)
+
+    return grid, pd.DataFrame(densities, index=pd.Index(list(df.columns), name='year'))
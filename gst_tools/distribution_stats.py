@@ -0,0 +1,179 @@
+# Project and Title: Global Stocktake Toolkit - distribution statistics
+
+# Purpose: Precompute the statistics that are shown on the histograms (max, min, mean,
+# median, number of countries, outliers, countries above / below zero) plus a set of
+# quantiles for every variable and every year, and store them in one table so that
+# reports and plot annotations can look them up rather than recalculate them.
+
+# =====================================================
+
+import os
+import glob
+import warnings
+
+import pandas as pd
+import numpy as np
+
+from .gst_utils import set_countries_as_index
+from .instrumentation import instrument
+
+# ======================
+
+default_quantiles = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+def calculate_column_stats(values, quantiles=default_quantiles, suffix=''):
+
+    """
+    Basic statistics of each column of a 2D array (countries x years), ignoring NaNs.
+    Returns a dict of statistic name -> 1D array with one value per column.
+    """
+
+    with warnings.catch_warnings():
+        # all-NaN years give warnings, but the result (NaN) is what we want
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+
+        stats = {
+            'count': np.sum(~np.isnan(values), axis=0),
+            'max': np.nanmax(values, axis=0),
+            'min': np.nanmin(values, axis=0),
+            'mean': np.nanmean(values, axis=0),
+            'median': np.nanmedian(values, axis=0),
+            'n_below_zero': np.sum(values < 0, axis=0),
+            'n_above_zero': np.sum(values > 0, axis=0),
+        }
+
+        if quantiles:
+            quantile_values = np.nanpercentile(values, [100 * quantile for quantile in quantiles], axis=0)
+            for quantile, quantile_value in zip(quantiles, quantile_values):
+                stats['q{:g}'.format(100 * quantile)] = quantile_value
+
+    return {name + suffix: stat for name, stat in stats.items()}
+
+
+@instrument
+def calculate_distribution_stats(df, quantiles=default_quantiles, ktuk=3):
+
+    """
+    Calculates the histogram statistics for all years of a dataframe with countries as index
+    and years as columns, in one go. Outliers are identified with Tukey's fences (as in
+    make_histogram, k = ktuk) and the statistics are given both for all countries and
+    excluding the outliers ('_excl_outliers').
+    Returns the statistics (one row per year) and a table of the outliers
+    (year, country, value, and whether it's a 'lower' or 'upper' outlier).
+    """
+
+    values = df.values.astype(float)
+    years = list(df.columns)
+
+    stats = calculate_column_stats(values, quantiles=quantiles)
+
+    # Tukey's fences, see make_histogram
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        q25, q75 = np.nanpercentile(values, [25, 75], axis=0)
+    iqr = q75 - q25
+    stats['tukey_min'] = q25 - ktuk * iqr
+    stats['tukey_max'] = q75 + ktuk * iqr
+
+    with np.errstate(invalid='ignore'):
+        lower_outliers = values < stats['tukey_min']
+        upper_outliers = values > stats['tukey_max']
+    stats['n_lower_outliers'] = lower_outliers.sum(axis=0)
+    stats['n_upper_outliers'] = upper_outliers.sum(axis=0)
+
+    # make_histogram only keeps values strictly inside the fences
+    with np.errstate(invalid='ignore'):
+        inside = (values > stats['tukey_min']) & (values < stats['tukey_max'])
+    values_excl_outliers = np.where(inside, values, np.nan)
+    stats.update(calculate_column_stats(values_excl_outliers, quantiles=None, suffix='_excl_outliers'))
+
+    summary = pd.DataFrame(stats, index=pd.Index(years, name='year'))
+
+    country_rows, year_columns = np.nonzero(lower_outliers | upper_outliers)
+    outliers = pd.DataFrame({'year': np.array(years)[year_columns],
+                             'country': np.array(df.index)[country_rows],
+                             'value': values[country_rows, year_columns],
+                             'side': np.where(lower_outliers[country_rows, year_columns], 'lower', 'upper')})
+
+    return summary, outliers
+
+
+@instrument
+def build_summary_table(proc_data_folder='proc-data', quantiles=default_quantiles, ktuk=3):
+
+    """
+    Calculates the distribution statistics for every variable in every proc-data file. If a file
+    holds several categories or scenarios of a variable, each is named variable-category-scenario.
+    Returns one table indexed by (variable, year) - so that the stats for any variable and year
+    are looked up directly with summary.loc[(variable, year)] - and one table of all outliers.
+    """
+
+    summaries = []
+    outlier_tables = []
+
+    for fname in sorted(glob.glob(os.path.join(proc_data_folder, '**', '*.csv'), recursive=True)):
+
+        data = pd.read_csv(fname)
+        if not {'country', 'variable'}.issubset(data.columns):
+            print('Skipping ' + fname + ' - no country or variable column.')
+            continue
+
+        # some files hold several categories or scenarios of a variable - these are kept apart
+        group_columns = ['variable'] + [column for column in ['category', 'scenario']
+                                        if (column in data.columns) and (data[column].nunique() > 1)]
+
+        for group, variable_data in data.groupby(group_columns):
+
+            variable = '-'.join(map(str, group)) if isinstance(group, tuple) else str(group)
+
+            if variable_data['country'].duplicated().any():
+                print('WARNING: countries are repeated for ' + variable + ' in ' + fname + ' - skipping.')
+                continue
+
+            data_years = set_countries_as_index(variable_data)
+            summary, outliers = calculate_distribution_stats(data_years, quantiles=quantiles, ktuk=ktuk)
+
+            summary['unit'] = variable_data['unit'].iloc[0] if 'unit' in variable_data.columns else ''
+            summary['file'] = os.path.basename(fname)
+            summaries.append(pd.concat({variable: summary}, names=['variable']))
+
+            outliers.insert(0, 'variable', variable)
+            outlier_tables.append(outliers)
+
+    if not summaries:
+        print('No data found in ' + proc_data_folder)
+        return None, None
+
+    summary_table = pd.concat(summaries).sort_index()
+    outlier_table = pd.concat(outlier_tables, ignore_index=True)
+
+    return summary_table, outlier_table
+
+
+def save_summary_table(summary_table, outlier_table, folder=os.path.join('output', 'summary')):
+
+    """
+    Writes the summary and outlier tables to csv files in the given folder.
+    """
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    summary_table.to_csv(os.path.join(folder, 'distribution-summary.csv'))
+    outlier_table.to_csv(os.path.join(folder, 'distribution-outliers.csv'), index=False)
+
+    print('Summary tables written to ' + folder)
+
+
+def load_summary_table(folder=os.path.join('output', 'summary')):
+
+    """
+    Reads the summary and outlier tables written by save_summary_table.
+    """
+
+    summary_table = pd.read_csv(os.path.join(folder, 'distribution-summary.csv'),
+                                index_col=['variable', 'year'], dtype={'year': str})
+    outlier_table = pd.read_csv(os.path.join(folder, 'distribution-outliers.csv'), dtype={'year': str})
+
+    return summary_table, outlier_table
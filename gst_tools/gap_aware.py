@@ -0,0 +1,145 @@
+# Project and Title: Global Stocktake Toolkit - gap-aware trends and peaking
+
+# Purpose: Gap-aware versions of the trend, difference and peaking calculations.
+# Instead of dropping every country (or year) with a single missing value, the
+# values are kept together with a mask of which cells are valid, each statistic is
+# calculated from the valid cells only, and the number of values used (the effective
+# sample size) is returned with every result.
+
+# =====================================================
+
+import pandas as pd
+import numpy as np
+
+from .instrumentation import instrument
+
+# ======================
+
+
+def get_values_and_mask(df):
+
+    """
+    The values of a dataframe (countries x years) as a float array, and a boolean array that is
+    True where there is data.
+    """
+
+    values = df.values.astype(float)
+    valid = ~np.isnan(values)
+
+    return values, valid
+
+
+def rolling_valid_mean(values, valid, window, min_valid):
+
+    """
+    Mean over a rolling window (along the years, i.e. axis 1) of the valid values only, using
+    cumulative sums so that all countries and years are calculated at once. Windows with fewer
+    than min_valid valid values are NaN. Returns the means and the number of valid values in
+    each window.
+    """
+
+    filled = np.where(valid, values, 0.)
+
+    # cumulative sums with a leading zero, so that window sums are differences
+    cumulative_sum = np.concatenate([np.zeros((values.shape[0], 1)), np.cumsum(filled, axis=1)], axis=1)
+    cumulative_count = np.concatenate([np.zeros((values.shape[0], 1), dtype=int),
+                                       np.cumsum(valid, axis=1)], axis=1)
+
+    window_sum = np.full(values.shape, np.nan)
+    window_count = np.zeros(values.shape, dtype=int)
+    window_sum[:, (window - 1):] = cumulative_sum[:, window:] - cumulative_sum[:, :-window]
+    window_count[:, (window - 1):] = cumulative_count[:, window:] - cumulative_count[:, :-window]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        window_mean = np.where(window_count >= max(1, min_valid), window_sum / window_count, np.nan)
+
+    return window_mean, window_count
+
+
+@instrument
+def calculate_trends_gap_aware(df, num_years_trend=10, min_valid_years=None):
+
+    """
+    Gap-aware version of gst_utils.calculate_trends. An annual % change is only calculated where
+    both years have data (gaps are not bridged) and the rolling average uses the valid annual changes
+    in each window, as long as there are at least min_valid_years of them (default: half the window).
+    Returns the annual % change, the rolling average, the unit and the number of annual changes
+    averaged for each country and year.
+    """
+
+    if min_valid_years is None:
+        min_valid_years = max(1, num_years_trend // 2)
+
+    values, valid = get_values_and_mask(df)
+
+    # annual % change, only where both years are valid
+    change_valid = np.zeros(values.shape, dtype=bool)
+    change_valid[:, 1:] = valid[:, 1:] & valid[:, :-1]
+    perc_change = np.full(values.shape, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        perc_change[:, 1:] = 100 * (values[:, 1:] / values[:, :-1] - 1)
+
+    # changes from zero are infinite - treat as missing
+    change_valid = change_valid & np.isfinite(perc_change)
+    perc_change[~change_valid] = np.nan
+
+    rolling_average, sample_size = rolling_valid_mean(perc_change, change_valid, num_years_trend, min_valid_years)
+
+    df_perc_change = pd.DataFrame(perc_change, index=df.index, columns=df.columns)
+    df_rolling_average = pd.DataFrame(rolling_average, index=df.index, columns=df.columns)
+    df_sample_size = pd.DataFrame(sample_size, index=df.index, columns=df.columns)
+
+    return df_perc_change, df_rolling_average, '%', df_sample_size
+
+
+@instrument
+def calculate_diff_since_yearX_gap_aware(df_abs, yearX):
+
+    """
+    Gap-aware version of gst_utils.calculate_diff_since_yearX. Differences are only calculated
+    where both the year and the reference year have data (and the reference is not zero for the
+    % difference); all other countries are kept, rather than dropped. Also returns the number of
+    countries with a valid % difference in each year.
+    """
+
+    if yearX not in df_abs.columns:
+        print('The year you have selected for relative calculations ('
+              + str(yearX) + ') is not available, please try again.')
+        return
+
+    values, valid = get_values_and_mask(df_abs)
+    reference = values[:, [list(df_abs.columns).index(yearX)]]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        abs_diff = values - reference
+        perc_diff = 100 * abs_diff / reference
+    perc_diff[~np.isfinite(perc_diff)] = np.nan
+
+    df_abs_diff = pd.DataFrame(abs_diff, index=df_abs.index, columns=df_abs.columns)
+    df_perc_diff = pd.DataFrame(perc_diff, index=df_abs.index, columns=df_abs.columns)
+    sample_size = pd.Series((~np.isnan(perc_diff)).sum(axis=0), index=df_abs.columns, name='countries')
+
+    return df_abs_diff, df_perc_diff, sample_size
+
+
+@instrument
+def calculate_peak_year(df, min_valid_years=1):
+
+    """
+    Year of the maximum value for each country, ignoring missing years instead of dropping them
+    (the notebooks drop every year in which any country is missing data before using idxmax).
+    Countries with fewer than min_valid_years of data get NaN. Returns the peak years and the
+    number of valid years for each country.
+    """
+
+    values, valid = get_values_and_mask(df)
+    years = np.array(list(map(int, df.columns)))
+
+    n_valid = valid.sum(axis=1)
+    peak_position = np.argmax(np.where(valid, values, -np.inf), axis=1)
+    peak_year = np.where(n_valid >= max(1, min_valid_years), years[peak_position], np.nan)
+
+    peak_year = pd.Series(peak_year, index=df.index, name='peak year')
+    n_valid = pd.Series(n_valid, index=df.index, name='valid years')
+
+    return peak_year, n_valid
@@ -0,0 +1,171 @@
+# Project and Title: Global Stocktake Toolkit - country group aggregation
+
+# Purpose: Aggregate country-year data to country groups (negotiating blocs etc.)
+# using a sparse (group, country) membership matrix so that all groups and all
+# years are calculated at once.
+
+# =====================================================
+
+import pandas as pd
+import numpy as np
+from scipy import sparse
+
+from countrygroups import UNFCCC, EUROPEAN_UNION, LDC, SIDS, UMBRELLA, ANNEX_ONE, NON_ANNEX_ONE
+
+from .instrumentation import instrument
+
+# ======================
+
+
+def get_default_groups():
+
+    """
+    The country groups that are most commonly used in the notebooks, as a dict of
+    group name -> list of ISO3 codes.
+    """
+
+    default_groups = {
+        'UNFCCC': list(UNFCCC),
+        'EUROPEAN_UNION': list(EUROPEAN_UNION),
+        'LDC': list(LDC),
+        'SIDS': list(SIDS),
+        'UMBRELLA': list(UMBRELLA),
+        'ANNEX_ONE': list(ANNEX_ONE),
+        'NON_ANNEX_ONE': list(NON_ANNEX_ONE),
+    }
+
+    return default_groups
+
+
+def make_membership_matrix(countries, groups=None):
+
+    """
+    Builds a sparse (group, country) membership matrix. Element [i, j] is 1 if
+    country j is a member of group i and 0 otherwise.
+    'countries' is the list of countries in the order they appear in the data
+    (e.g. the index of a dataframe with countries as index). 'groups' is a dict
+    of group name -> list of country codes; if not given, the default groups are used.
+    Countries that are in a group but not in the data are simply ignored.
+    """
+
+    if groups is None:
+        groups = get_default_groups()
+
+    # map each country to its column in the matrix
+    country_position = {country: pos for pos, country in enumerate(countries)}
+
+    rows = []
+    cols = []
+    for row, group_name in enumerate(groups):
+        members = [country_position[country] for country in set(groups[group_name])
+                   if country in country_position]
+        rows.extend([row] * len(members))
+        cols.extend(members)
+
+    membership = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                   shape=(len(groups), len(countries)))
+
+    return membership, list(groups)
+
+
+@instrument
+def calculate_group_stats(df, groups=None):
+
+    """
+    Calculates the number of countries with data, the total, the mean and the standard
+    deviation of the countries in each group, for every year.
+    'df' should have countries as index and years as columns (e.g. the output of
+    set_countries_as_index). Missing values are ignored, so each statistic is calculated
+    over the countries of the group that have data in that year.
+    The count, total and mean of all groups and years come from a single sparse matrix product;
+    the standard deviation from a second pass over the members, around the group mean.
+    Returns a dict of dataframes (group x year), one per statistic.
+    """
+
+    membership, group_names = make_membership_matrix(df.index, groups=groups)
+
+    values = df.values.astype(float)
+    valid = ~np.isnan(values)
+    values = np.where(valid, values, 0.)
+
+    # stack the count and sum so that only one product is needed
+    nyears = values.shape[1]
+    result = membership.dot(np.hstack([valid.astype(float), values]))
+
+    count = result[:, :nyears]
+    total = result[:, nyears:]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+
+    # squared deviations from the group mean, summed per group and year (one bincount for all).
+    # The sum of squares minus the squared mean would cancel badly for large values (emissions).
+    pairs = membership.tocoo()
+    deviations = np.where(valid[pairs.col], values[pairs.col] - mean[pairs.row], 0.)
+    positions = (pairs.row[:, np.newaxis] * nyears + np.arange(nyears)[np.newaxis, :]).ravel()
+    centred_squares = np.bincount(positions, weights=(deviations ** 2).ravel(),
+                                  minlength=len(group_names) * nyears).reshape(len(group_names), nyears)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(centred_squares / count)
+
+    def to_frame(array):
+        return pd.DataFrame(array, index=pd.Index(group_names, name='group'), columns=df.columns)
+
+    group_stats = {
+        'count': to_frame(count),
+        'total': to_frame(total),
+        'mean': to_frame(mean),
+        'std': to_frame(std),
+    }
+
+    return group_stats
+
+
+@instrument
+def calculate_group_totals(df, groups=None):
+
+    """
+    Sum of all countries in each group, for every year. Countries without data in a
+    given year are treated as zero - check the 'count' output of calculate_group_stats
+    if coverage is a concern.
+    """
+
+    group_stats = calculate_group_stats(df, groups=groups)
+
+    return group_stats['total']
+
+
+@instrument
+def calculate_group_per_capita(df, df_population, groups=None):
+
+    """
+    Calculates group-level 'per capita' values as the sum of the variable over the
+    sum of the population (i.e. not the mean of the country per capita values).
+    Only country-years where both datasets have data are included so that the
+    numerator and denominator always cover the same countries.
+    Both dataframes should have countries as index and years as columns. Any other
+    denominator (e.g. GDP) can be used in place of population.
+    """
+
+    # align the two datasets on common countries and years
+    countries = df.index.intersection(df_population.index)
+    years = df.columns.intersection(df_population.columns)
+    numerator = df.loc[countries, years].values.astype(float)
+    denominator = df_population.loc[countries, years].values.astype(float)
+
+    valid = ~(np.isnan(numerator) | np.isnan(denominator))
+    numerator = np.where(valid, numerator, 0.)
+    denominator = np.where(valid, denominator, 0.)
+
+    membership, group_names = make_membership_matrix(countries, groups=groups)
+
+    nyears = len(years)
+    result = membership.dot(np.hstack([numerator, denominator]))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        per_capita = result[:, :nyears] / result[:, nyears:]
+
+    per_capita = pd.DataFrame(per_capita, index=pd.Index(group_names, name='group'), columns=years)
+
+    return per_capita
@@ -18,9 +18,18 @@ import sys
 import pandas as pd
 import numpy as np
 
+from . import country_codes
+from .instrumentation import instrument, report_progress
+
 # ======================
 
+__all__ = ['set_non_year_cols_as_index', 'set_countries_as_index', 'calculate_trends', 'change_first_year',
+           'check_column_order', 'ensure_common_years', 'ensure_common_countries', 'align_datasets',
+           'calculate_diff_since_yearX', 'verify_data_format', 'make_uba_color_dict', 'convert_ISO2_to_ISO3',
+           'convert_ISO3_to_name']
+
 
+@instrument
 def set_non_year_cols_as_index(df):
 
     """ 
@@ -46,6 +55,7 @@ def set_non_year_cols_as_index(df):
     return df, other_cols
 
 
+@instrument
 def set_countries_as_index(df):
 
         """
@@ -80,6 +90,7 @@ def set_countries_as_index(df):
         return df
 
 
+@instrument
 def calculate_trends(df, num_years_trend=10):
 
     """
@@ -87,18 +98,19 @@ def calculate_trends(df, num_years_trend=10):
     """
 
     # disp average used for trend
-    print('Averaging trend over ' + str(num_years_trend) + ' years.')
+    report_progress('Averaging trend over ' + str(num_years_trend) + ' years.')
 
     # calculate annual % changes
     df_perc_change = df.pct_change(axis='columns') * 100
     new_unit = '%'
 
-    # average over a window
-    df_rolling_average = df_perc_change.rolling(window=num_years_trend, axis='columns').mean()
+    # average over a window (rolling along the years; rolling(axis=...) is no longer supported by pandas)
+    df_rolling_average = df_perc_change.T.rolling(window=num_years_trend).mean().T
 
     return df_perc_change, df_rolling_average, new_unit
 
 
+@instrument
 def change_first_year(df, new_start_year):
 
     """
@@ -140,12 +152,13 @@ def change_first_year(df, new_start_year):
     df = check_column_order(df)
 
     # tell the user what happened
-    print('First year of data available is now ' + str(new_start_year))
-    print('Last year of data available is ' + str(last_year))
+    report_progress('First year of data available is now ' + str(new_start_year),
+                    'Last year of data available is ' + str(last_year))
 
     return df
 
 
+@instrument
 def check_column_order(df):
 
     """
@@ -180,6 +193,7 @@ def check_column_order(df):
     return reordered_df
 
 
+@instrument
 def ensure_common_years(df1, df2):
 
     """
@@ -211,6 +225,7 @@ def ensure_common_years(df1, df2):
     return df1, df2
 
 
+@instrument
 def ensure_common_countries(df1, df2):
 
     """
@@ -222,8 +237,7 @@ def ensure_common_countries(df1, df2):
     df2_countries = df2['country'].unique()
     common_countries = list(set(df1_countries).intersection(df2_countries))
 
-    print('Common countries are: ')
-    print(common_countries)
+    report_progress('Common countries are: ', common_countries)
     # TODO - spit out list of countries not found!
 
     # reset matrices
@@ -233,6 +247,25 @@ def ensure_common_countries(df1, df2):
     return df1, df2
 
 
+@instrument
+def align_datasets(datasets):
+
+    """
+    Reduces dataframes (countries x years) to the countries and years they all have in common.
+    """
+
+    countries = datasets[0].index
+    years = datasets[0].columns
+    for df in datasets[1:]:
+        countries = countries.intersection(df.index)
+        years = years.intersection(df.columns)
+
+    years = sorted(years, key=int)
+
+    return [df.loc[countries, years] for df in datasets]
+
+
+@instrument
 def calculate_diff_since_yearX(df_abs, yearX):
 
     """
@@ -240,7 +273,7 @@ def calculate_diff_since_yearX(df_abs, yearX):
     For example, % difference relative to 1990 in all years.
     """
 
-    print('Calculating difference compared to ' + yearX)
+    report_progress('Calculating difference compared to ' + yearX)
 
     # first, check that the desired year is in the data!
     if yearX not in df_abs.columns:
@@ -257,6 +290,7 @@ def calculate_diff_since_yearX(df_abs, yearX):
     return df_abs_diff, df_perc_diff
 
 
+@instrument
 def verify_data_format(df):
 
     """
@@ -331,20 +365,22 @@ def make_uba_color_dict():
     return uba_colours
 
 
-def convert_ISO2_to_ISO3():
+@instrument
+def convert_ISO2_to_ISO3(codes):
 
     """
-    convert a country 2-letter ISO code to a 3-letter ISO code.
+    convert country 2-letter ISO codes to 3-letter ISO codes.
+    Works on a single list, array or Series of codes at once - see country_codes.
     """
 
-    country_code_file = "country_codes.csv"
-    country_codes = pd.read_csv(country_code_file)
-
+    return country_codes.convert_ISO2_to_ISO3(codes)
 
 
+@instrument
+def convert_ISO3_to_name(codes):
 
-def convert_ISO3_to_name():
-
     """
-    convert a 3-letter ISO code to a full country name
-    """
\ No newline at end of file
+    convert 3-letter ISO codes to full country names
+    """
+
+    return country_codes.convert_ISO3_to_name(codes)
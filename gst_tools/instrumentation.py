@@ -0,0 +1,313 @@
+# Project and Title: Global Stocktake Toolkit - timing and memory instrumentation
+
+# Purpose: Record how long the gst_tools functions take, how much data they
+# handle and how much memory they need, so that it's clear where the time in
+# a batch run goes. Nothing is recorded (or printed) unless the user asks for it.
+# The progress messages of the gst_tools functions (outliers found, bins used, ...)
+# also go through here (report_progress): printed only in verbose mode and kept with the
+# run report while recording.
+
+# Example:
+#     from gst_tools import instrumentation
+#     instrumentation.start_recording(track_memory=True)
+#     instrumentation.set_verbose(True)    # to also see the progress messages
+#     ... run the analysis ...
+#     instrumentation.print_flame_summary()
+#     instrumentation.write_run_report('run-report.csv')
+
+# =====================================================
+
+import os
+import csv
+import json
+import time
+import threading
+import functools
+import tracemalloc
+import contextlib
+
+import pandas as pd
+
+# ======================
+
+settings = {'enabled': False, 'track_memory': False, 'verbose': False}
+
+run_records = []
+run_messages = []
+
+record_lock = threading.Lock()
+call_stack = threading.local()
+
+
+def start_recording(track_memory=False):
+
+    """
+    Switches on recording for all instrumented functions. Tracking memory uses tracemalloc,
+    which makes everything noticeably slower, so it is optional.
+    Previous records are cleared.
+    """
+
+    reset_run_report()
+    settings['enabled'] = True
+    settings['track_memory'] = track_memory
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def stop_recording():
+
+    """
+    Switches recording off again. The records are kept until the next start_recording.
+    """
+
+    settings['enabled'] = False
+    if settings['track_memory'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    settings['track_memory'] = False
+
+
+def reset_run_report():
+
+    with record_lock:
+        del run_records[:]
+        del run_messages[:]
+
+
+def set_verbose(verbose=True):
+
+    """
+    Switches printing of the progress messages of the gst_tools functions on (or off).
+    """
+
+    settings['verbose'] = verbose
+
+
+def report_progress(*lines):
+
+    """
+    Progress message from a gst_tools function, one or more lines (strings, series, lists...).
+    Printed only in verbose mode, and kept with the call path it came from while recording.
+    """
+
+    if settings['verbose']:
+        for line in lines:
+            print(line)
+
+    if settings['enabled']:
+        stack = getattr(call_stack, 'entries', [])
+        path = ';'.join([entry['name'] for entry in stack])
+        with record_lock:
+            run_messages.append({'path': path, 'message': '\n'.join(str(line) for line in lines)})
+
+
+def get_data_size(args, kwargs):
+
+    """
+    Number of rows and cells of the first dataframe or series passed to a function.
+    """
+
+    for arg in list(args) + list(kwargs.values()):
+        if isinstance(arg, (pd.DataFrame, pd.Series)):
+            return arg.shape[0], arg.size
+
+    return None, None
+
+
+@contextlib.contextmanager
+def instrument_block(name, rows=None, cells=None):
+
+    """
+    Records the wall time and (optionally) peak memory of the code inside the 'with' block.
+    Blocks can be nested - calls inside the block are recorded as its children.
+    """
+
+    if not settings['enabled']:
+        yield
+        return
+
+    if not hasattr(call_stack, 'entries'):
+        call_stack.entries = []
+    stack = call_stack.entries
+
+    path = ';'.join([entry['name'] for entry in stack] + [name])
+    entry = {'name': name, 'saved_peak': 0}
+
+    track_memory = settings['track_memory'] and tracemalloc.is_tracing()
+    if track_memory:
+        entry['start_memory'] = tracemalloc.get_traced_memory()[0]
+        # reset_peak is only available from python 3.9, before that the peak covers the whole run.
+        # Resetting discards the peak of the enclosing block so far, so it is saved with that block first.
+        if hasattr(tracemalloc, 'reset_peak'):
+            if stack:
+                stack[-1]['saved_peak'] = max(stack[-1]['saved_peak'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+    stack.append(entry)
+    error = ''
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as exception:
+        error = type(exception).__name__
+        raise
+    finally:
+        wall_time = time.perf_counter() - start
+        stack.pop()
+
+        peak_alloc = None
+        if track_memory:
+            peak = max(tracemalloc.get_traced_memory()[1], entry['saved_peak'])
+            peak_alloc = (peak - entry['start_memory']) / 1e6
+            if stack:
+                stack[-1]['saved_peak'] = max(stack[-1]['saved_peak'], peak)
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+
+        with record_lock:
+            run_records.append({'name': name, 'path': path, 'depth': len(stack),
+                                'wall_time_s': wall_time, 'rows': rows, 'cells': cells,
+                                'peak_alloc_mb': peak_alloc, 'error': error})
+
+
+def instrument(function):
+
+    """
+    Decorator that records every call of the function (see instrument_block), including the
+    size of the first dataframe or series it is given.
+    """
+
+    @functools.wraps(function)
+    def instrumented_function(*args, **kwargs):
+
+        if not settings['enabled']:
+            return function(*args, **kwargs)
+
+        rows, cells = get_data_size(args, kwargs)
+        with instrument_block(function.__name__, rows=rows, cells=cells):
+            return function(*args, **kwargs)
+
+    return instrumented_function
+
+
+def get_run_report():
+
+    """
+    All records as a dataframe, one row per call, in the order the calls finished.
+    """
+
+    with record_lock:
+        records = list(run_records)
+
+    columns = ['name', 'path', 'depth', 'wall_time_s', 'rows', 'cells', 'peak_alloc_mb', 'error']
+
+    return pd.DataFrame(records, columns=columns)
+
+
+def get_run_messages():
+
+    """
+    All progress messages reported while recording, with the call path they came from.
+    """
+
+    with record_lock:
+        messages = list(run_messages)
+
+    return pd.DataFrame(messages, columns=['path', 'message'])
+
+
+def summarise_run_report():
+
+    """
+    Number of calls, total and mean time, total cells handled and largest peak memory per function,
+    with the most time-consuming function first. Times of nested calls are included in their parents.
+    """
+
+    report = get_run_report()
+
+    grouped = report.groupby('name')
+    summary = pd.DataFrame({'calls': grouped['wall_time_s'].size(),
+                            'total_time_s': grouped['wall_time_s'].sum(),
+                            'mean_time_s': grouped['wall_time_s'].mean(),
+                            'total_cells': grouped['cells'].sum(),
+                            'max_peak_alloc_mb': grouped['peak_alloc_mb'].max()})
+
+    return summary.sort_values('total_time_s', ascending=False)
+
+
+def write_run_report(filename):
+
+    """
+    Writes all records to a .json or .csv file (chosen by the file ending).
+    """
+
+    folder = os.path.dirname(filename)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    report = get_run_report()
+
+    if filename.endswith('.json'):
+        with open(filename, 'w') as f:
+            json.dump(report.to_dict(orient='records'), f, indent=1)
+    else:
+        report.to_csv(filename, index=False, quoting=csv.QUOTE_NONNUMERIC)
+
+    print('Run report written to ' + filename)
+
+
+def get_folded_stacks():
+
+    """
+    Total time (in ms) spent in each call path *excluding* time in nested calls, in the 'folded'
+    format used by flame graph tools (e.g. 'change_first_year;check_column_order 12').
+    """
+
+    report = get_run_report()
+    if report.empty:
+        return {}
+
+    total_time = report.groupby('path')['wall_time_s'].sum()
+
+    # remove the time of the children from their parents
+    self_time = total_time.copy()
+    for path, wall_time in total_time.items():
+        if ';' in path:
+            parent = path.rsplit(';', 1)[0]
+            if parent in self_time.index:
+                self_time[parent] -= wall_time
+
+    return {path: max(0., wall_time) * 1000 for path, wall_time in self_time.items()}
+
+
+def write_folded_stacks(filename):
+
+    """
+    Writes the folded stacks to a text file that can be turned into a flame graph (e.g. with flamegraph.pl).
+    """
+
+    with open(filename, 'w') as f:
+        for path, milliseconds in sorted(get_folded_stacks().items()):
+            f.write(path + ' ' + str(int(round(milliseconds))) + '\n')
+
+
+def print_flame_summary(width=40):
+
+    """
+    Prints the call tree with the total time of each path and a bar showing its share of the run.
+    """
+
+    report = get_run_report()
+    if report.empty:
+        print('Nothing recorded - use start_recording() first.')
+        return
+
+    grouped = report.groupby('path')
+    totals = pd.DataFrame({'calls': grouped['wall_time_s'].size(), 'total_time_s': grouped['wall_time_s'].sum()})
+    run_time = totals.loc[[path for path in totals.index if ';' not in path], 'total_time_s'].sum()
+
+    for path, row in totals.sort_index().iterrows():
+        depth = path.count(';')
+        share = row['total_time_s'] / run_time if run_time > 0 else 0
+        label = '  ' * depth + path.rsplit(';', 1)[-1]
+        print('{:<40s} {:<{width}s} {:8.3f} s {:5.1f}% ({:.0f} calls)'.format(
+            label, '#' * int(round(share * width)), row['total_time_s'], share * 100, row['calls'], width=width))
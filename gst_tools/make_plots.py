@@ -10,19 +10,78 @@
 
 # =====================================================
 
-import re, sys, os
+import re, sys, os, time
 
 import pandas as pd
 import numpy as np
 
-import matplotlib as mpl
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-from shortcountrynames import to_name
+from .country_codes import convert_to_short_names
+from .density import calculate_kde
+from .distribution_stats import calculate_column_stats
+from .instrumentation import instrument, report_progress
+from .weighted_distributions import weighted_quantile
 
 # ======================
 
+# what 'from gst_tools.make_plots import *' gives - the plotting functions, but not the module
+# handles below, which would replace the user's own plt, sns etc. (with None before the first plot)
+__all__ = ['import_plotting_modules', 'get_uba_colours', 'set_uba_palette', 'get_histogram_bins',
+           'make_histogram', 'make_weighted_histogram', 'make_histogram_peaking', 'plot_facet_grid_countries',
+           'peaking_barplot', 'make_cumulative_share_plot', 'make_ridge_plot', 'make_overlapping_kde_plot',
+           'get_frame_counts', 'make_histogram_animation']
+
+# matplotlib, seaborn and shortcountrynames are slow to import. So that data-only work with
+# gst_tools stays fast (and doesn't need a display), they are imported the first time a plot is made.
+mpl = None
+plt = None
+sns = None
+to_name = None
+
+
+def is_headless():
+
+    """
+    True if there is no display to show plots on and we are not running in a notebook.
+    """
+
+    if 'ipykernel' in sys.modules:
+        return False
+
+    if sys.platform.startswith('linux'):
+        return not (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+
+    return False
+
+
+def import_plotting_modules():
+
+    """
+    Imports the plotting libraries (only once). If there is no display and the user hasn't
+    chosen a backend themselves, the non-interactive 'Agg' backend is used so that plots can
+    still be saved to file.
+    """
+
+    global mpl, plt, sns, to_name
+
+    if plt is not None:
+        return
+
+    import matplotlib
+
+    if is_headless() and ('matplotlib.pyplot' not in sys.modules) and not os.environ.get('MPLBACKEND'):
+        matplotlib.use('Agg')
+
+    import matplotlib.pyplot
+    import matplotlib.ticker
+    import matplotlib.animation
+    import seaborn
+    from shortcountrynames import to_name as short_name
+
+    mpl = matplotlib
+    plt = matplotlib.pyplot
+    sns = seaborn
+    to_name = short_name
+
 
 # UBA colour scheme for all functions
 def get_uba_colours():
@@ -64,100 +123,18 @@ def set_uba_palette():
 
     return uba_palette
 
-# main plotting function used throughout - flexibility given so that it can cope with a range of different input!
 
-
-def make_histogram(df, unit_,
-                   xlabel='', title='', sourcename='unspecified',
-                   remove_outliers=False, ktuk=3,
-                   save_plot=False, plot_name='',
-                   selected_country=''):
+def get_histogram_bins(df, min_bin_width=None):
 
     """
-    This is based on the make_simple_histogram function but caters to data that
-    contains both positive and negative values. For the GST, it's important to be
-    able to see whether or not trends etc. are positive or negative and a symmetric
-    binning approach is needed.
-
-    To calculate the bin sizes, we use a couple of conditional rules based on the data
-    available, including the max and min of the data and the number of data points.
-    For most plots we are expecting around 200 countries, but could also be a few regions.
-
-    TODO - 'df' is actually a series -> better name?
-    TODO - edit selected country option to deal with ISO codes or names.
+    Bins for the histograms, based on the data available. If there are both positive and negative
+    values, the bins are symmetric around 0 (Freedman-Diaconis width, rounded down to an integer,
+    and at least min_bin_width if given). Otherwise, small values get bins of width 1 and larger
+    ones the inbuilt Freedman-Diaconis rule ('fd').
     """
 
-    # announce the plot..
-    print('---------')
-    print('Making  ' + str(plot_name) + ' plot.')
-    print('---------')
-
-    # Check the data - needs to not be, for example, all zeros
-    if len(df.unique()) == 1:
-        print('---------')
-        print('All values in the series are the same! Exiting plotting routine for ' + str(plot_name))
-        print('---------')
-        return
-
-    # get the value here in case it's excluded as an outlier
-    if selected_country:
-        # get value of that country
-        country_value = df[selected_country]
-
-    # set a style
-    # attempting to modify to UBA grid style but didn't work.
-    #sns.set_style('darkgrid', {'xtick.color': '.95', 'grid.color': '.5'})
-    sns.set(style='darkgrid')
-    sns.set_palette(set_uba_palette())
-    uba_colours = get_uba_colours()
-    sns.set(font="Calibri")
-
-    if remove_outliers:
-        # Outliers - in some cases, the date contains extreme outliers. These make for an unreadable
-        # plot and in most cases arise from exceptional circumstances. These outliers are therefore removed
-        # from the plots and the removal signalled to the user.
-        # Example: Equatorial Guinea's emissions rose dramatically in the mid-90s due to the discovery of
-        # oil. So much so, that the current emissions relative to 1990 are over 6000% higher. Including these
-        # emissions in the plots would render a useless graph so we remove this country from the overview.
-
-        # Use Tukey's fences and the interquartile range to set the bounds of the data
-        # https://en.wikipedia.org/wiki/Outlier
-        # For reference: kTUk default is set to 3 (above)
-        # k = 1.5 -> outlier; k = 3 -> far out
-        # TODO - get full and proper reference for this!!!
-
-        print('-----------')
-        print('Identifying and removing outliers')
-
-        # calculate limits
-        q75, q25 = np.percentile(df, [75, 25])
-        iqr = q75 - q25
-        tukey_min = q25 - ktuk * iqr
-        tukey_max = q75 + ktuk * iqr
-        # for testing:
-        # print('tukey_min is ' + str(tukey_min))
-        # print('tukey_max is ' + str(tukey_max))
-
-        # Tell the user what the outliers are:
-        lower_outliers = df[df < tukey_min]
-        print('lower outliers are:')
-        print(lower_outliers)
-        upper_outliers = df[df > tukey_max]
-        print('upper outliers are: ')
-        print(upper_outliers)
-        print('---')
-
-        noutliers = len(lower_outliers) + len(upper_outliers)
-
-        # actually remove the outliers
-        df = df[(df > tukey_min) & (df < tukey_max)]
-
-    # STATS
-    # get some basic info about the data to use for setting styles, calculating bin sizes, and annotating plot
     maximum = max(df)
     minimum = min(df)
-    mean = np.mean(df)
-    median = np.median(df)
     npts = len(df)
 
     # Use data metrics to determine which approach to use for bins.
@@ -172,6 +149,8 @@ def make_histogram(df, unit_,
         q75, q25 = np.percentile(df, [75, 25])
         iqr = q75 - q25
         bin_width = int(2 * (iqr) / (npts ** (1 / 3)))
+        if min_bin_width is not None:
+            bin_width = max(min_bin_width, bin_width)
 
         # or the simple 'excel' rule:
         # bin_width = int(full_range / np.ceil(npts**(0.5)))
@@ -183,7 +162,7 @@ def make_histogram(df, unit_,
 
         # determine bin edges
         bins_calc = range(int((0 - (1 + nbins / 2) * bin_width)), int((0 + (1 + nbins / 2) * bin_width)), bin_width)
-        print('bins set to ' + str(bins_calc))
+        report_progress('bins set to ' + str(bins_calc))
 
     else:
         if maximum < 25:
@@ -198,120 +177,179 @@ def make_histogram(df, unit_,
 
             # determine bin edges
             bins_calc = range(0, int(1 + nbins), bin_width)
-            print('bins set to ' + str(bins_calc))
+            report_progress('bins set to ' + str(bins_calc))
 
         else:
             # use inbuilt Freedman-Diaconis
             # ? TODO - modify to ensure integers? or replicate above?
             bins_calc = 'fd'
 
-    # --------------
-    # MAKE THE PLOT
+    return bins_calc
 
-    # set up the figure
-    fig, axs = plt.subplots()
 
-    # make histogram
-    sns.distplot(df,
-                 kde=False,
-                 bins=bins_calc,
-                 hist_kws=dict(alpha=0.75),
-                 color=uba_colours['uba_dark_green'])
-                 #rug=False,
-                 #rug_kws={"color": "rebeccapurple", "alpha": 0.7, "linewidth": 0.4, "height": 0.03})
+def set_histogram_style():
 
-    # get xlims
-    xmin, xmax = axs.get_xlim()
+    """
+    Sets the seaborn style and UBA palette used for the histograms and returns the UBA colours.
+    """
 
-    # Dynamically set x axis range to make symmetric abut 0
-    if minimum < 0:
+    # attempting to modify to UBA grid style but didn't work.
+    #sns.set_style('darkgrid', {'xtick.color': '.95', 'grid.color': '.5'})
+    sns.set(style='darkgrid')
+    sns.set_palette(set_uba_palette())
+    uba_colours = get_uba_colours()
+    sns.set(font="Calibri")
 
-        # reset xmin or xmax
-        if np.absolute(xmax) > np.absolute(xmin):
-            plt.xlim(-xmax, xmax)
-        else:
-            plt.xlim(xmin, -xmin)
+    return uba_colours
 
-        # and add a line at 0
-        axs.axvline(linewidth=1, color='k')
 
-        # and annotate with the number of countries either side of the line
-        # ARROWS!
+def find_outliers(df, ktuk=3):
+
+    """
+    Finds the outliers with Tukey's fences and tells the user (in verbose mode) what they are.
+    Returns which values to keep (boolean series) and the number of outliers.
+    """
+
+    # Outliers - in some cases, the date contains extreme outliers. These make for an unreadable
+    # plot and in most cases arise from exceptional circumstances. These outliers are therefore removed
+    # from the plots and the removal signalled to the user.
+    # Example: Equatorial Guinea's emissions rose dramatically in the mid-90s due to the discovery of
+    # oil. So much so, that the current emissions relative to 1990 are over 6000% higher. Including these
+    # emissions in the plots would render a useless graph so we remove this country from the overview.
+
+    # Use Tukey's fences and the interquartile range to set the bounds of the data
+    # https://en.wikipedia.org/wiki/Outlier
+    # For reference: kTUk default is set to 3 (above)
+    # k = 1.5 -> outlier; k = 3 -> far out
+    # TODO - get full and proper reference for this!!!
+
+    report_progress('-----------', 'Identifying and removing outliers')
+
+    # calculate limits
+    q75, q25 = np.percentile(df, [75, 25])
+    iqr = q75 - q25
+    tukey_min = q25 - ktuk * iqr
+    tukey_max = q75 + ktuk * iqr
+    # for testing:
+    # print('tukey_min is ' + str(tukey_min))
+    # print('tukey_max is ' + str(tukey_max))
+
+    # Tell the user what the outliers are:
+    lower_outliers = df[df < tukey_min]
+    upper_outliers = df[df > tukey_max]
+    report_progress('lower outliers are:', lower_outliers, 'upper outliers are: ', upper_outliers, '---')
+
+    noutliers = len(lower_outliers) + len(upper_outliers)
+
+    return (df > tukey_min) & (df < tukey_max), noutliers
 
-        nbelow = len(df[df < 0])
-        nabove = len(df[df > 0])
 
-        axs.annotate(str(nbelow) + ' countries',
-                     xytext=(0.31, 1.0), xycoords=axs.transAxes,
+def annotate_either_side_of_zero(axs, label_below, label_above, arrow_x=(0.15, 0.85), text_x=(0.31, 0.54)):
+
+    """
+    Makes the x axis symmetric about 0, adds a line at 0 and annotates the plot with what is
+    on either side of it (e.g. the number of countries), with arrows.
+    """
+
+    xmin, xmax = axs.get_xlim()
+
+    # reset xmin or xmax
+    if np.absolute(xmax) > np.absolute(xmin):
+        axs.set_xlim(-xmax, xmax)
+    else:
+        axs.set_xlim(xmin, -xmin)
+
+    # and add a line at 0
+    axs.axvline(linewidth=1, color='k')
+
+    # ARROWS!
+    for label, x_arrow, x_text in zip([label_below, label_above], arrow_x, text_x):
+        axs.annotate(label,
+                     xytext=(x_text, 1.0), xycoords=axs.transAxes,
                      fontsize=9, color='black',
-                     xy=(0.15, 1.01),
+                     xy=(x_arrow, 1.01),
                      arrowprops=dict(arrowstyle="-|>", color='black'),
                      bbox=dict(facecolor='white', edgecolor='grey', alpha=0.75)
                      )
-        axs.annotate(str(nabove) + ' countries',
-                     xytext=(0.54, 1.0), xycoords=axs.transAxes,
-                     fontsize=9, color='black',
-                     xy=(0.85, 1.01),
-                     arrowprops=dict(arrowstyle="-|>", color='black'),
-                     bbox=dict(facecolor='white', edgecolor='grey', alpha=0.75)
+
+
+def annotate_selected_country(axs, selected_country, country_value, unit_, xmin, xmax, uba_colours):
+
+    """
+    Marks the selected country on the plot (with a line if its value is within xmin and xmax)
+    and annotates it with its name and value.
+    """
+
+    label = (to_name(selected_country) + ' ' + "\n{:.2g}".format(country_value)) + ' ' + unit_
+
+    if (country_value > xmin) & (country_value < xmax):
+        # indicate it on the plot
+        axs.axvline(x=country_value, ymax=0.9, linewidth=1.5, color=uba_colours['uba_dark_purple'])
+
+        # annotate with country name
+        ymin, ymax = axs.get_ylim()
+        ypos = 0.65 * ymax
+        axs.annotate(label,
+                     xy=(country_value, ypos), xycoords='data',
+                     fontsize=9, color=uba_colours['uba_dark_purple'],
+                     bbox=dict(facecolor='white', edgecolor=uba_colours['uba_dark_purple'], alpha=0.75)
                      )
 
-    # If a country is selected for highlighting, then indicate it on the plot!
-    if selected_country:
+    else:
+        axs.annotate(label,
+                     xy=(.75, .65), xycoords=axs.transAxes,
+                     fontsize=9, color=uba_colours['uba_dark_purple'],
+                     bbox=dict(facecolor='white', edgecolor=uba_colours['uba_dark_purple'], alpha=0.75)
+                     )
 
-        # get value of that country
-        # country_value = df[selected_country]
 
-        if (country_value > xmin) & (country_value < xmax):
-            # indicate it on the plot
-            axs.axvline(x=country_value, ymax=0.9, linewidth=1.5, color=uba_colours['uba_dark_purple'])
+def annotate_histogram_stats(axs, sourcename, maximum, minimum, mean, median, npts, noutliers=None,
+                             weighted=False):
 
-            # annotate with country name
-            ymin, ymax = axs.get_ylim()
-            ypos = 0.65 * ymax
-            axs.annotate((to_name(selected_country) + ' ' + "\n{:.2g}".format(country_value)) + ' ' + unit_,
-                         xy=(country_value, ypos), xycoords='data',
-                         fontsize=9, color=uba_colours['uba_dark_purple'],
-                         bbox=dict(facecolor='white', edgecolor=uba_colours['uba_dark_purple'], alpha=0.75)
-                         )
+    """
+    Annotates the plot with the data source and stats, and the number of outliers not shown
+    (if they were removed).
+    """
 
-        else:
-            axs.annotate((to_name(selected_country) + ' ' + "\n{:.2g}".format(country_value)) + ' ' + unit_,
-                         xy=(.75, .65), xycoords=axs.transAxes,
-                         fontsize=9, color=uba_colours['uba_dark_purple'],
-                         bbox=dict(facecolor='white', edgecolor=uba_colours['uba_dark_purple'], alpha=0.75)
-                         )
+    prefix = "\n weighted " if weighted else ""
+    ypos = 0.5 if weighted else 0.6
 
-    # Annotate the plot with stats
     axs.annotate(("Data source: \n " + sourcename + "\n"
                   "\n maximum  = {:.2f}".format(maximum) +
                   "\n minimum   = {:.2f}".format(minimum) +
-                  "\n mean        = {:.2f}".format(mean) +
-                  "\n median     = {:.2f}".format(median) +
+                  prefix + "\n mean        = {:.2f}".format(mean) +
+                  prefix + "\n median     = {:.2f}".format(median) +
                   "\n number of \n countries  = {:.0f}".format(npts)
                   ),
-                 xy=(1.05, 0.6), xycoords=axs.transAxes,
+                 xy=(1.05, ypos), xycoords=axs.transAxes,
                  fontsize=9, color='black',
                  bbox=dict(facecolor='white', edgecolor='grey', alpha=0.75))
 
     # if some countries were removed, indicate on the plot
-    if remove_outliers:
+    if noutliers is not None:
         axs.annotate(('  ' + str(noutliers) + ' outliers not shown'),
-                     xy=(1.05, 0.53), xycoords=axs.transAxes,
+                     xy=(1.05, ypos - 0.07), xycoords=axs.transAxes,
                      fontsize=8, color='black')
 
+
+def finish_histogram(axs, xlabel, unit_, ylabel, title, save_plot, fname_prefix, plot_name, selected_country):
+
+    """
+    Labels the axes, adds the title, saves the plot to output/plots (if save_plot) and shows it.
+    """
+
     # label axes and add title
     axs.set_xlabel((xlabel + ' \n(' + unit_ + ')'), fontsize=12)
-    axs.set_ylabel('number of countries', fontsize=12)
+    axs.set_ylabel(ylabel, fontsize=12)
     axs.set_title((title + "\n"), fontweight='bold')
 
     # save to file
     if save_plot:
         filepath = os.path.join('output', 'plots')
         if selected_country:
-            fname = ('basic_histogram-' + plot_name + '-' + to_name(selected_country) + '.png')
+            fname = (fname_prefix + '-' + plot_name + '-' + to_name(selected_country) + '.png')
         else:
-            fname = ('basic_histogram-' + plot_name + '.png')
+            fname = (fname_prefix + '-' + plot_name + '.png')
         if not os.path.exists(filepath):
             os.makedirs(filepath)
         filename = os.path.join(filepath, fname)
@@ -322,6 +360,190 @@ def make_histogram(df, unit_,
     plt.show()
 
 
+# main plotting function used throughout - flexibility given so that it can cope with a range of different input!
+
+
+@instrument
+def make_histogram(df, unit_,
+                   xlabel='', title='', sourcename='unspecified',
+                   remove_outliers=False, ktuk=3,
+                   save_plot=False, plot_name='',
+                   selected_country=''):
+
+    """
+    This is based on the make_simple_histogram function but caters to data that
+    contains both positive and negative values. For the GST, it's important to be
+    able to see whether or not trends etc. are positive or negative and a symmetric
+    binning approach is needed.
+
+    To calculate the bin sizes, we use a couple of conditional rules based on the data
+    available, including the max and min of the data and the number of data points.
+    For most plots we are expecting around 200 countries, but could also be a few regions.
+
+    TODO - 'df' is actually a series -> better name?
+    TODO - edit selected country option to deal with ISO codes or names.
+    """
+
+    import_plotting_modules()
+
+    # announce the plot..
+    report_progress('---------', 'Making  ' + str(plot_name) + ' plot.', '---------')
+
+    # Check the data - needs to not be, for example, all zeros
+    if len(df.unique()) == 1:
+        print('---------')
+        print('All values in the series are the same! Exiting plotting routine for ' + str(plot_name))
+        print('---------')
+        return
+
+    # get the value here in case it's excluded as an outlier
+    if selected_country:
+        # get value of that country
+        country_value = df[selected_country]
+
+    # set a style
+    uba_colours = set_histogram_style()
+
+    noutliers = None
+    if remove_outliers:
+        # actually remove the outliers
+        inside, noutliers = find_outliers(df, ktuk=ktuk)
+        df = df[inside]
+
+    # STATS
+    # get some basic info about the data to use for setting styles, calculating bin sizes, and annotating plot
+    # (the same statistics as in the distribution summary table, see distribution_stats)
+    stats = calculate_column_stats(df.values.astype(float)[:, np.newaxis], quantiles=None)
+    stats = {name: stat[0] for name, stat in stats.items()}
+
+    bins_calc = get_histogram_bins(df)
+
+    # --------------
+    # MAKE THE PLOT
+
+    # set up the figure
+    fig, axs = plt.subplots()
+
+    # make histogram
+    sns.distplot(df,
+                 kde=False,
+                 bins=bins_calc,
+                 hist_kws=dict(alpha=0.75),
+                 color=uba_colours['uba_dark_green'])
+                 #rug=False,
+                 #rug_kws={"color": "rebeccapurple", "alpha": 0.7, "linewidth": 0.4, "height": 0.03})
+
+    # get xlims
+    xmin, xmax = axs.get_xlim()
+
+    # Dynamically set x axis range to make symmetric abut 0
+    if stats['min'] < 0:
+        # and annotate with the number of countries either side of the line
+        annotate_either_side_of_zero(axs, str(stats['n_below_zero']) + ' countries',
+                                     str(stats['n_above_zero']) + ' countries')
+
+    # If a country is selected for highlighting, then indicate it on the plot!
+    if selected_country:
+        annotate_selected_country(axs, selected_country, country_value, unit_, xmin, xmax, uba_colours)
+
+    # Annotate the plot with stats
+    annotate_histogram_stats(axs, sourcename, stats['max'], stats['min'], stats['mean'], stats['median'],
+                             stats['count'], noutliers=noutliers)
+
+    finish_histogram(axs, xlabel, unit_, 'number of countries', title,
+                     save_plot, 'basic_histogram', plot_name, selected_country)
+
+
+@instrument
+def make_weighted_histogram(df, df_weights, unit_,
+                            xlabel='', title='', sourcename='unspecified', weight_name='population',
+                            remove_outliers=False, ktuk=3,
+                            save_plot=False, plot_name='',
+                            selected_country=''):
+
+    """
+    Version of make_histogram in which each country counts with its weight (e.g. its population)
+    instead of once, so the bars show the share (%) of the total weight - e.g. of the world
+    population - in each bin. 'df' and 'df_weights' are series indexed by country (one year);
+    only countries with both a value and a weight are used. Bins, outlier removal, styling and
+    annotations are those of make_histogram, with weighted mean, median and shares.
+    """
+
+    import_plotting_modules()
+
+    # announce the plot..
+    report_progress('---------', 'Making  ' + str(plot_name) + ' plot.', '---------')
+
+    df_weights = df_weights.reindex(df.index)
+    keep = df.notnull() & df_weights.notnull()
+    df = df[keep]
+    df_weights = df_weights[keep]
+
+    # Check the data - needs to not be, for example, all zeros
+    if len(df.unique()) == 1:
+        print('---------')
+        print('All values in the series are the same! Exiting plotting routine for ' + str(plot_name))
+        print('---------')
+        return
+
+    # get the value here in case it's excluded as an outlier
+    if selected_country:
+        country_value = df[selected_country]
+
+    uba_colours = set_histogram_style()
+
+    noutliers = None
+    if remove_outliers:
+        # Tukey's fences on the (unweighted) values, as in make_histogram
+        inside, noutliers = find_outliers(df, ktuk=ktuk)
+        df = df[inside]
+        df_weights = df_weights[inside]
+
+    # STATS - weighted
+    total_weight = df_weights.sum()
+    shares = 100 * df_weights / total_weight
+    maximum = max(df)
+    minimum = min(df)
+    mean = np.average(df, weights=df_weights)
+    # interpolated like np.median, so equal weights give the median of make_histogram
+    median = weighted_quantile(df.values, df_weights.values, [0.5])[0]
+    npts = len(df)
+
+    bins_calc = get_histogram_bins(df)
+    edges = np.histogram_bin_edges(df, bins=bins_calc)
+    heights, edges = np.histogram(df, bins=edges, weights=shares)
+
+    # --------------
+    # MAKE THE PLOT
+
+    fig, axs = plt.subplots()
+
+    axs.bar(edges[:-1], heights, width=np.diff(edges), align='edge',
+            alpha=0.75, color=uba_colours['uba_dark_green'], edgecolor='white')
+
+    xmin, xmax = axs.get_xlim()
+
+    # Dynamically set x axis range to make symmetric abut 0
+    if minimum < 0:
+        # annotate with the share of the weight either side of the line
+        share_below = shares[df < 0].sum()
+        share_above = shares[df > 0].sum()
+        annotate_either_side_of_zero(axs, '{:.0f}% of '.format(share_below) + weight_name,
+                                     '{:.0f}% of '.format(share_above) + weight_name,
+                                     arrow_x=(0.1, 0.9), text_x=(0.25, 0.54))
+
+    # If a country is selected for highlighting, then indicate it on the plot!
+    if selected_country:
+        annotate_selected_country(axs, selected_country, country_value, unit_, xmin, xmax, uba_colours)
+
+    annotate_histogram_stats(axs, sourcename, maximum, minimum, mean, median, npts, noutliers=noutliers,
+                             weighted=True)
+
+    finish_histogram(axs, xlabel, unit_, '% of ' + weight_name, title,
+                     save_plot, 'weighted_histogram', plot_name, selected_country)
+
+
+@instrument
 def make_histogram_peaking(df, var, unit_, start_year, end_year, save_plot=False):
 
     """
@@ -329,6 +551,8 @@ def make_histogram_peaking(df, var, unit_, start_year, end_year, save_plot=False
     of countries.
     """
 
+    import_plotting_modules()
+
     uba_palette = set_uba_palette()
     sns.set_palette(uba_palette)
     sns.set(style="darkgrid", context="paper")
@@ -415,6 +639,7 @@ def make_histogram_peaking(df, var, unit_, start_year, end_year, save_plot=False
     plt.show()
 
 
+@instrument
 def plot_facet_grid_countries(df, variable, value, main_title='', plot_name='', save_plot=False):
 
     """
@@ -422,6 +647,8 @@ def plot_facet_grid_countries(df, variable, value, main_title='', plot_name='',
     which countries have emissions that have peaked, and which not.
     """
 
+    import_plotting_modules()
+
     uba_palette = set_uba_palette()
     sns.set_palette(uba_palette)
     sns.set(style="darkgrid", context="paper")
@@ -439,7 +666,7 @@ def plot_facet_grid_countries(df, variable, value, main_title='', plot_name='',
     # set up the df for plotting
     year_cols = df.columns
     dftomelt = df.reset_index()
-    dftomelt['country'] = dftomelt['country'].apply(to_name)
+    dftomelt['country'] = convert_to_short_names(dftomelt['country'])
     dfmelt = pd.melt(dftomelt, id_vars=['country'],
                      value_vars=year_cols, var_name=variable, value_name=value)
 
@@ -477,8 +704,11 @@ def plot_facet_grid_countries(df, variable, value, main_title='', plot_name='',
         plt.close()
 
 
+@instrument
 def peaking_barplot(summary_data, variable, max_year, save_plot=False):
 
+    import_plotting_modules()
+
     uba_palette = set_uba_palette()
     sns.set_palette(uba_palette)
     sns.set(style="darkgrid", context="paper")
@@ -510,3 +740,400 @@ def peaking_barplot(summary_data, variable, max_year, save_plot=False):
         plt.savefig(filename, format='png', dpi=600, bbox_inches='tight')
         plt.close()
 
+
+
+@instrument
+def make_cumulative_share_plot(df_shares, years, variable, thresholds=(50, 80, 90),
+                               sourcename='unspecified', save_plot=False, plot_name=''):
+
+    """
+    Cumulative share of the total (e.g. of global emissions) against the number of countries,
+    largest first, for each of the chosen years (the output of contributions.calculate_cumulative_shares).
+    The thresholds are marked and annotated with the number of countries needed to reach them
+    in the last of the years.
+    """
+
+    import_plotting_modules()
+
+    uba_palette = set_uba_palette()
+    uba_colours = get_uba_colours()
+    sns.set(style="darkgrid", context="paper")
+    sns.set(font="Calibri")
+
+    fig, axs = plt.subplots()
+
+    for year, colour in zip(years, uba_palette):
+        shares = df_shares[year].dropna()
+        axs.plot(shares.index, shares.values, linewidth=1.5, color=colour, label=str(year))
+
+    # mark the thresholds for the last year
+    last_shares = df_shares[years[-1]].dropna()
+    for threshold in thresholds:
+        reached = last_shares[last_shares >= threshold]
+        if reached.empty:
+            continue
+        n_countries = reached.index[0]
+        axs.axhline(y=threshold, linewidth=0.8, linestyle='--', color=uba_colours['uba_dark_grey'])
+        axs.axvline(x=n_countries, ymax=threshold / 105, linewidth=0.8, linestyle='--',
+                    color=uba_colours['uba_dark_grey'])
+        axs.annotate('{:g}%: {} countries'.format(threshold, n_countries),
+                     xy=(n_countries, threshold), xytext=(5, -12), textcoords='offset points',
+                     fontsize=9, color='black',
+                     bbox=dict(facecolor='white', edgecolor='grey', alpha=0.75))
+
+    axs.set_ylim(0, 105)
+    axs.set_xlim(0, len(last_shares) + 1)
+
+    axs.annotate("Data source: \n " + sourcename,
+                 xy=(1.05, 0.85), xycoords=axs.transAxes,
+                 fontsize=9, color='black',
+                 bbox=dict(facecolor='white', edgecolor='grey', alpha=0.75))
+
+    axs.legend(loc='lower right')
+    axs.set_xlabel('number of countries (largest first)', fontsize=12)
+    axs.set_ylabel('cumulative share of total (%)', fontsize=12)
+    axs.set_title(('Cumulative share of ' + variable + "\n"), fontweight='bold')
+
+    if save_plot:
+        filepath = os.path.join('output', 'plots')
+        fname = ('cumulative-share-' + plot_name + '.png')
+        if not os.path.exists(filepath):
+            os.makedirs(filepath)
+        filename = os.path.join(filepath, fname)
+        plt.savefig(filename, format='png', dpi=600, bbox_inches='tight')
+        plt.close()
+
+    plt.show()
+
+
+@instrument
+def make_ridge_plot(df, years, unit_, variable, clip=None, bandwidth='scott', overlap=0.5,
+                    sourcename='unspecified', save_plot=False, plot_name=''):
+
+    """
+    Ridge plot of the distribution across countries in each of the chosen years (columns of df):
+    one kernel density per year, stacked from the first year at the top and overlapping by
+    'overlap' (0 - 1). The densities are calculated for all years at once (density.calculate_kde)
+    and drawn on a single set of axes. Values outside 'clip' (min, max) are left out.
+    Replaces make_ridge_plot in the archive.
+    """
+
+    import_plotting_modules()
+
+    uba_palette = set_uba_palette()
+    uba_colours = get_uba_colours()
+    sns.set(style="white", context="paper", font="Calibri")
+
+    years = [str(year) for year in years]
+    grid, densities = calculate_kde(df[years], bandwidth=bandwidth, clip=clip)
+
+    # each ridge is scaled to the highest density so that all have the same height
+    spacing = (1 - overlap) * np.nanmax(densities.values)
+
+    fig, axs = plt.subplots(figsize=(7, 1 + 0.5 * len(years)))
+
+    for i, year in enumerate(years):
+        baseline = (len(years) - 1 - i) * spacing
+        density = densities.loc[year].values
+        colour = uba_palette[i % (len(uba_palette) - 2)]
+        axs.fill_between(grid, baseline, baseline + density, color=colour, alpha=0.8, linewidth=0, zorder=2 * i)
+        axs.plot(grid, baseline + density, color='k', linewidth=0.8, zorder=2 * i + 1)
+        axs.axhline(y=baseline, color=colour, linewidth=1.5, zorder=2 * i + 1)
+        axs.text(grid[0], baseline + 0.1 * spacing, year, fontweight='bold', color=colour, fontsize=8,
+                 ha='left', va='bottom')
+
+    # line at 0 if the data are both positive and negative
+    if grid[0] < 0 < grid[-1]:
+        axs.axvline(x=0, linewidth=1, color=uba_colours['uba_dark_grey'], zorder=2 * len(years))
+
+    axs.set_xlim(grid[0], grid[-1])
+    axs.set_yticks([])
+    sns.despine(ax=axs, left=True)
+
+    axs.annotate("Data source: \n " + sourcename,
+                 xy=(1.05, 0.85), xycoords=axs.transAxes,
+                 fontsize=9, color='black',
+                 bbox=dict(facecolor='white', edgecolor='grey', alpha=0.75))
+
+    axs.set_xlabel((variable + ' \n(' + unit_ + ')'), fontsize=12)
+    axs.set_title(('Distribution of ' + variable + "\n"), fontweight='bold')
+
+    if save_plot:
+        filepath = os.path.join('output', 'plots')
+        fname = ('kde_ridges-' + plot_name + '.png')
+        if not os.path.exists(filepath):
+            os.makedirs(filepath)
+        filename = os.path.join(filepath, fname)
+        plt.savefig(filename, format='png', dpi=600, bbox_inches='tight')
+        plt.close()
+
+    plt.show()
+
+
+@instrument
+def make_overlapping_kde_plot(df, years, unit_, variable, clip=None, bandwidth='scott',
+                              sourcename='unspecified', save_plot=False, plot_name=''):
+
+    """
+    Kernel densities of the distribution across countries in each of the chosen years (columns of
+    df), overlapping on one set of axes, in the UBA colours. The densities are calculated for all
+    years at once (density.calculate_kde). Replaces make_overlapping_kde_plots in the archive.
+    """
+
+    import_plotting_modules()
+
+    uba_palette = set_uba_palette()
+    uba_colours = get_uba_colours()
+    sns.set(style="darkgrid", context="paper")
+    sns.set(font="Calibri")
+
+    years = [str(year) for year in years]
+    grid, densities = calculate_kde(df[years], bandwidth=bandwidth, clip=clip)
+
+    fig, axs = plt.subplots()
+
+    for i, year in enumerate(years):
+        colour = uba_palette[i % (len(uba_palette) - 2)]
+        axs.fill_between(grid, 0, densities.loc[year].values, color=colour, alpha=0.3, linewidth=0)
+        axs.plot(grid, densities.loc[year].values, color=colour, linewidth=1.5, label=year)
+
+    if grid[0] < 0 < grid[-1]:
+        axs.axvline(x=0, linewidth=1, color=uba_colours['uba_dark_grey'])
+
+    axs.set_xlim(grid[0], grid[-1])
+    axs.set_ylim(bottom=0)
+    axs.legend()
+
+    axs.annotate("Data source: \n " + sourcename,
+                 xy=(1.05, 0.85), xycoords=axs.transAxes,
+                 fontsize=9, color='black',
+                 bbox=dict(facecolor='white', edgecolor='grey', alpha=0.75))
+
+    axs.set_xlabel((variable + ' \n(' + unit_ + ')'), fontsize=12)
+    axs.set_ylabel('density', fontsize=12)
+    axs.set_title(('Distribution of ' + variable + "\n"), fontweight='bold')
+
+    if save_plot:
+        filepath = os.path.join('output', 'plots')
+        fname = ('kde_overlapping-' + plot_name + '.png')
+        if not os.path.exists(filepath):
+            os.makedirs(filepath)
+        filename = os.path.join(filepath, fname)
+        plt.savefig(filename, format='png', dpi=600, bbox_inches='tight')
+        plt.close()
+
+    plt.show()
+
+
+def get_frame_counts(values, edges):
+
+    """
+    Histogram counts of each column (year) of a 2D array (countries x years) on fixed bin edges,
+    all years at once. Values outside the edges and NaNs are not counted. Returns years x bins.
+    """
+
+    n_bins = len(edges) - 1
+    n_years = values.shape[1]
+
+    with np.errstate(invalid='ignore'):
+        inside = ~np.isnan(values) & (values >= edges[0]) & (values <= edges[-1])
+    bin_index = np.clip(np.searchsorted(edges, values[inside], side='right') - 1, 0, n_bins - 1)
+
+    counts = np.bincount(n_bins * np.nonzero(inside)[1] + bin_index, minlength=n_bins * n_years)
+
+    return counts.reshape(n_years, n_bins)
+
+
+@instrument
+def make_histogram_animation(df, unit_, years=None,
+                             xlabel='', title='', sourcename='unspecified',
+                             remove_outliers=False, ktuk=3,
+                             output_format='gif', fps=2, dpi=150, plot_name='', verbose=True):
+
+    """
+    Animation of the distribution across countries (index of df) over the years (columns), in
+    the style of make_histogram. The figure, bins, axes and annotations are set up once, on a bin
+    layout that is fixed for all years, and each frame only updates the bar heights, the number
+    of countries either side of zero and the stats. If remove_outliers is True, Tukey's fences
+    (k = ktuk) are calculated over all years together so that the x axis stays the same.
+    output_format is 'gif' (needs Pillow - without it the frames are written as png), 'mp4' (needs
+    ffmpeg) or 'png' (one file per frame); the output goes to output/plots. Returns the file names
+    written.
+    """
+
+    import_plotting_modules()
+
+    if years is None:
+        years = list(df.columns)
+    years = [str(year) for year in years]
+
+    start_time = time.perf_counter()
+
+    values = df[years].values.astype(float)
+
+    noutliers = np.zeros(len(years), dtype=int)
+    if remove_outliers:
+        q75, q25 = np.nanpercentile(values, [75, 25])
+        iqr = q75 - q25
+        with np.errstate(invalid='ignore'):
+            outliers = (values <= q25 - ktuk * iqr) | (values >= q75 + ktuk * iqr)
+        noutliers = outliers.sum(axis=0)
+        values = np.where(outliers, np.nan, values)
+
+    # fixed bins, from all years together, and all the frames' data up front. With many years pooled
+    # a narrow distribution (IQR below ~npts^(1/3) / 2) would round to a bin width of 0 - no bins, and
+    # no animation at all - so the width is at least 1 here
+    all_values = pd.Series(values[~np.isnan(values)])
+    edges = np.histogram_bin_edges(all_values, bins=get_histogram_bins(all_values, min_bin_width=1))
+    counts = get_frame_counts(values, edges)
+    stats = calculate_column_stats(values, quantiles=None)
+
+    # --------------
+    # SET UP THE PLOT (once)
+
+    sns.set(style='darkgrid', font="Calibri")
+    uba_colours = get_uba_colours()
+
+    # the layout is fixed (room on the right for the stats) so frames don't need a tight bounding box
+    fig, axs = plt.subplots(figsize=(8, 5), dpi=dpi)
+    fig.subplots_adjust(left=0.1, right=0.72, top=0.82, bottom=0.15)
+
+    bars = axs.bar(edges[:-1], counts[0], width=np.diff(edges), align='edge',
+                   alpha=0.75, color=uba_colours['uba_dark_green'], edgecolor='white')
+
+    axs.set_ylim(0, 1.1 * counts.max())
+    minimum = all_values.min()
+    maximum = all_values.max()
+    if minimum < 0:
+        limit = max(abs(edges[0]), abs(edges[-1]))
+        axs.set_xlim(-limit, limit)
+        zero_line = axs.axvline(linewidth=1, color='k')
+    else:
+        axs.set_xlim(edges[0], edges[-1])
+        zero_line = None
+
+    text_below = None
+    text_above = None
+    if minimum < 0:
+        text_below = axs.annotate('', xytext=(0.31, 1.0), xycoords=axs.transAxes,
+                                  fontsize=9, color='black', xy=(0.15, 1.01),
+                                  arrowprops=dict(arrowstyle="-|>", color='black'),
+                                  bbox=dict(facecolor='white', edgecolor='grey', alpha=0.75))
+        text_above = axs.annotate('', xytext=(0.54, 1.0), xycoords=axs.transAxes,
+                                  fontsize=9, color='black', xy=(0.85, 1.01),
+                                  arrowprops=dict(arrowstyle="-|>", color='black'),
+                                  bbox=dict(facecolor='white', edgecolor='grey', alpha=0.75))
+
+    stats_text = axs.annotate('', xy=(1.05, 0.6), xycoords=axs.transAxes,
+                              fontsize=9, color='black',
+                              bbox=dict(facecolor='white', edgecolor='grey', alpha=0.75))
+    outlier_text = None
+    if remove_outliers:
+        outlier_text = axs.annotate('', xy=(1.05, 0.53), xycoords=axs.transAxes, fontsize=8, color='black')
+
+    axs.set_xlabel((xlabel + ' \n(' + unit_ + ')'), fontsize=12)
+    axs.set_ylabel('number of countries', fontsize=12)
+    title_text = axs.set_title('', fontweight='bold')
+
+    def update(frame):
+
+        for bar, height in zip(bars, counts[frame]):
+            bar.set_height(height)
+
+        if text_below is not None:
+            text_below.set_text(str(stats['n_below_zero'][frame]) + ' countries')
+            text_above.set_text(str(stats['n_above_zero'][frame]) + ' countries')
+
+        stats_text.set_text("Data source: \n " + sourcename + "\n"
+                            "\n maximum  = {:.2f}".format(stats['max'][frame]) +
+                            "\n minimum   = {:.2f}".format(stats['min'][frame]) +
+                            "\n mean        = {:.2f}".format(stats['mean'][frame]) +
+                            "\n median     = {:.2f}".format(stats['median'][frame]) +
+                            "\n number of \n countries  = {:.0f}".format(stats['count'][frame]))
+        if outlier_text is not None:
+            outlier_text.set_text('  ' + str(noutliers[frame]) + ' outliers not shown')
+
+        title_text.set_text(title + ' ' + years[frame] + "\n")
+
+        return list(bars) + [stats_text, title_text]
+
+    # everything that changes (or is drawn on top of the bars) is redrawn for each frame on top of
+    # a copy of the static background - axes, ticks, labels - which is only rendered once
+    dynamic_artists = [artist for artist in list(bars) + [zero_line, text_below, text_above, stats_text,
+                                                           outlier_text, title_text] if artist is not None]
+
+    def render_frame(frame):
+        update(frame)
+        fig.canvas.restore_region(background)
+        for artist in dynamic_artists:
+            fig.draw_artist(artist)
+        return np.asarray(fig.canvas.buffer_rgba())
+
+    # Pillow is optional: it writes the gif and makes writing the png frames faster
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+        if output_format == 'gif':
+            print('Pillow is not installed, so a gif cannot be written - writing the frames as png instead.')
+            output_format = 'png'
+
+    if output_format in ['png', 'gif']:
+        for artist in dynamic_artists:
+            artist.set_animated(True)
+        fig.canvas.draw()
+        background = fig.canvas.copy_from_bbox(fig.bbox)
+
+    setup_time = time.perf_counter() - start_time
+
+    # --------------
+    # WRITE THE FRAMES
+
+    filepath = os.path.join('output', 'plots')
+    if not os.path.exists(filepath):
+        os.makedirs(filepath)
+    fname = 'histogram_animation-' + plot_name
+
+    start_time = time.perf_counter()
+
+    if output_format == 'png':
+        filenames = []
+        for frame in range(len(years)):
+            filename = os.path.join(filepath, fname + '-' + years[frame] + '.png')
+            if Image is not None:
+                Image.fromarray(render_frame(frame)).save(filename, compress_level=1)
+            else:
+                mpl.image.imsave(filename, render_frame(frame))
+            filenames.append(filename)
+
+    elif output_format == 'gif':
+        images = [Image.fromarray(render_frame(frame)).convert('RGB').quantize(colors=64)
+                  for frame in range(len(years))]
+        filename = os.path.join(filepath, fname + '.gif')
+        images[0].save(filename, save_all=True, append_images=images[1:], duration=int(1000 / fps), loop=0)
+        filenames = [filename]
+
+    elif output_format == 'mp4':
+        # the ffmpeg writer saves the whole figure for each frame
+        if not mpl.animation.writers.is_available('ffmpeg'):
+            print('ffmpeg is not available to write mp4 - please install it or use gif or png.')
+            plt.close(fig)
+            return
+        filename = os.path.join(filepath, fname + '.mp4')
+        animation = mpl.animation.FuncAnimation(fig, update, frames=len(years), blit=False)
+        animation.save(filename, writer=mpl.animation.FFMpegWriter(fps=fps), dpi=dpi)
+        filenames = [filename]
+
+    else:
+        print('Output format must be gif, mp4 or png. Please try again.')
+        plt.close(fig)
+        return
+
+    frames_time = time.perf_counter() - start_time
+    plt.close(fig)
+
+    if verbose:
+        print('Animation of {} frames written to {}: set up {:.3f} s, {:.3f} s per frame'.format(
+              len(years), filepath, setup_time, frames_time / len(years)))
+
+    return filenames
@@ -0,0 +1,287 @@
+# Project and Title: Global Stocktake Toolkit - projection ensemble statistics
+
+# Purpose: Distributions of projected indicators (e.g. emissions in 2030) from large
+# scenario databases (model x scenario x country x year, IAMC format) without loading the
+# whole ensemble into memory. The file is streamed twice in chunks:
+#   1. count, sum, min and max of the members in each ensemble, country and year
+#   2. a fixed-bin histogram of the members between that min and max (and the spread
+#      around the mean) in each ensemble, country and year
+# The median and other quantiles are read off the histograms, so they are accurate to
+# within one bin ((max - min) / n_bins); count, mean, std, min and max are exact.
+# Each statistic of each ensemble is written in the proc-data format (countries x years),
+# so the histogram and peaking tools can be used on projected data as on historic data.
+
+# Example - distribution of the median projected 2030 emissions across countries, from a
+# scenario database downloaded in IAMC format (not included) and saved in input-data:
+#     stats = calculate_ensemble_statistics(os.path.join('input-data', 'scenario-database.csv'),
+#                                           'Emissions|Kyoto Gases', years=['2030'],
+#                                           ensembles={'1.5C': [...], '2C': [...]})
+#     data = set_countries_as_index(stats[('1.5C', 'median')])
+#     make_histogram(data['2030'], unit_=...)
+
+# =====================================================
+
+import os
+import re
+
+import pandas as pd
+import numpy as np
+
+from .chunked_aggregation import find_year_columns
+from .instrumentation import instrument
+
+# ======================
+
+# column names in IAMC-format scenario databases
+iamc_columns = {'model': 'Model', 'scenario': 'Scenario', 'country': 'Region',
+                'variable': 'Variable', 'unit': 'Unit'}
+
+default_data_config = os.path.join(os.path.dirname(__file__), 'configuration', 'data-config.yaml')
+default_quantiles = [0.1, 0.25, 0.75, 0.9]
+
+
+def read_data_config(filename=default_data_config, section='projection_data'):
+
+    """
+    Reads one section ('historic_data' or 'projection_data') of the data configuration file,
+    i.e. the names of the data files to use. Returns a dict of dataset -> file name.
+    """
+
+    import yaml
+
+    with open(filename) as config_file:
+        config = yaml.safe_load(config_file)
+
+    if section not in config:
+        print('"' + section + '" is not in the data configuration ' + filename + '. Please check!')
+        return
+
+    return config[section]
+
+
+def get_quantile_name(quantile):
+
+    return 'p{:g}'.format(100 * quantile)
+
+
+def stream_ensemble_chunks(filename, variable, membership, year_columns, countries=None,
+                           columns=iamc_columns, chunksize=100000):
+
+    """
+    Reads the scenario file in chunks and yields, for every row of the variable that belongs to an
+    ensemble, the ensemble number, the country, the unit and the values (rows x years).
+    'membership' is a dataframe of scenario -> ensemble number (a scenario can be in several
+    ensembles, and its rows are then repeated), or None to put all scenarios in one ensemble.
+    """
+
+    metadata = [columns['scenario'], columns['country'], columns['variable'], columns['unit']]
+
+    dtypes = {column: str for column in metadata}
+    dtypes.update({column: np.float64 for column in year_columns})
+
+    for chunk in pd.read_csv(filename, usecols=metadata + year_columns, dtype=dtypes, chunksize=chunksize):
+
+        chunk = chunk.loc[chunk[columns['variable']] == variable]
+        if countries is not None:
+            chunk = chunk.loc[chunk[columns['country']].isin(countries)]
+
+        if membership is None:
+            ensemble_rows = np.zeros(len(chunk), dtype=np.intp)
+        else:
+            chunk = chunk.merge(membership, on=columns['scenario'], how='inner')
+            ensemble_rows = chunk['ensemble_index'].values
+        if chunk.empty:
+            continue
+
+        yield ensemble_rows, chunk[columns['country']].values, chunk[columns['unit']], chunk[year_columns].values
+
+
+def interpolate_histogram_quantiles(counts, minimum, maximum, quantile):
+
+    """
+    Approximate quantile of the members in every cell from their histograms (cells x years x bins,
+    evenly spaced from minimum to maximum): the members in a bin are taken to be evenly spread
+    over it. Cells without members are NaN.
+    """
+
+    n_bins = counts.shape[-1]
+    n_members = counts.sum(axis=-1)
+
+    if quantile <= 0:
+        return np.where(n_members > 0, minimum, np.nan)
+    if quantile >= 1:
+        return np.where(n_members > 0, maximum, np.nan)
+
+    cumulative = np.cumsum(counts, axis=-1)
+    width = (maximum - minimum) / n_bins
+
+    def get_member(rank):
+        # the rank-th smallest member (from 0), placed within its bin
+        bins = np.argmax(cumulative > rank[..., np.newaxis], axis=-1)[..., np.newaxis]
+        in_bin = np.take_along_axis(counts, bins, axis=-1)[..., 0]
+        before_bin = np.take_along_axis(cumulative, bins, axis=-1)[..., 0] - in_bin
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = (rank - before_bin + 0.5) / in_bin
+        return np.clip(minimum + (bins[..., 0] + fraction) * width, minimum, maximum)
+
+    # interpolate linearly between the two members either side of the quantile, as numpy does
+    rank = quantile * np.maximum(n_members - 1, 0)
+    lower = np.floor(rank)
+    lower_member = get_member(lower)
+    values = lower_member + (rank - lower) * (get_member(np.minimum(lower + 1, n_members - 1)) - lower_member)
+
+    return np.where(n_members > 0, values, np.nan)
+
+
+@instrument
+def calculate_ensemble_statistics(filename, variable, ensembles=None, years=None, countries=None,
+                                  quantiles=default_quantiles, n_bins=500, source_name=None,
+                                  columns=iamc_columns, chunksize=100000, output_folder='proc-data',
+                                  write_files=True):
+
+    """
+    Streams a scenario file (IAMC format: model, scenario, region, variable, unit, years) and
+    calculates, for one variable, statistics of the ensemble members (model-scenario combinations)
+    in every country and year: count, mean, std, min, max, median and the given quantiles.
+    'ensembles' is a dict of ensemble name -> list of scenarios; if not given all scenarios are one
+    ensemble, 'all'. Only the given years and countries are used if these are specified - the
+    histograms need n_bins values per ensemble, country and year in memory.
+    The quantiles (and median) are accurate to within (max - min) / n_bins of each country-year.
+    Each statistic of each ensemble is written to its own file in the proc-data format, with the
+    ensemble as 'scenario' and the statistic in a 'statistic' column.
+    Returns the statistics as a dict of (ensemble, statistic) -> dataframe.
+    """
+
+    header = pd.read_csv(filename, nrows=0)
+    year_columns = find_year_columns(header.columns)
+    if years is not None:
+        missing_years = [year for year in years if str(year) not in year_columns]
+        if missing_years:
+            print('The years ' + str(missing_years) + ' are not in ' + filename + ', please try again.')
+            return
+        year_columns = [str(year) for year in years]
+
+    if ensembles is None:
+        ensemble_names = ['all']
+        membership = None
+    else:
+        ensemble_names = list(ensembles)
+        membership = pd.DataFrame([(scenario, ensemble_index)
+                                   for ensemble_index, ensemble in enumerate(ensemble_names)
+                                   for scenario in ensembles[ensemble]],
+                                  columns=[columns['scenario'], 'ensemble_index'])
+
+    def stream():
+        return stream_ensemble_chunks(filename, variable, membership, year_columns, countries=countries,
+                                      columns=columns, chunksize=chunksize)
+
+    # first pass - exact count, sum, min and max of each (ensemble, country), combined chunk by chunk
+    totals = None
+    units = set()
+    for ensemble_rows, country_rows, unit_rows, values in stream():
+
+        units.update(unit_rows.unique())
+
+        grouped = pd.DataFrame(values, index=pd.MultiIndex.from_arrays([ensemble_rows, country_rows]))
+        grouped = grouped.groupby(level=[0, 1])
+        chunk_totals = [grouped.count(), grouped.sum(), grouped.min(), grouped.max()]
+
+        if totals is not None:
+            chunk_totals = [pd.concat([total, chunk_total]).groupby(level=[0, 1])
+                            for total, chunk_total in zip(totals, chunk_totals)]
+            chunk_totals = [chunk_totals[0].sum(), chunk_totals[1].sum(),
+                            chunk_totals[2].min(), chunk_totals[3].max()]
+        totals = chunk_totals
+
+    if totals is None:
+        print('No data found for ' + variable + ' in ' + filename + '. Please check!')
+        return
+
+    cells = totals[0].index
+    n_members = totals[0].values.astype(np.int64)
+    minimum = totals[2].reindex(cells).values.astype(float)
+    maximum = totals[3].reindex(cells).values.astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = totals[1].reindex(cells).values / n_members
+
+    # second pass - histogram of the members between min and max, and the squared deviations
+    n_cells, n_years = n_members.shape
+    counts = np.zeros((n_cells, n_years, n_bins), dtype=np.int32)
+    squared_deviations = np.zeros(n_cells * n_years)
+    width = np.where(maximum > minimum, (maximum - minimum) / n_bins, 1.)
+
+    nrows = 0
+    for ensemble_rows, country_rows, unit_rows, values in stream():
+        nrows += len(values)
+
+        cell_rows = cells.get_indexer(pd.MultiIndex.from_arrays([ensemble_rows, country_rows]))
+        valid = ~np.isnan(values)
+        cell_positions = np.broadcast_to(cell_rows[:, np.newaxis], values.shape)[valid]
+        year_positions = np.broadcast_to(np.arange(n_years)[np.newaxis, :], values.shape)[valid]
+        values = values[valid]
+
+        bins = np.floor((values - minimum[cell_positions, year_positions]) / width[cell_positions, year_positions])
+        bins = np.clip(bins, 0, n_bins - 1).astype(np.int64)
+
+        positions = cell_positions * n_years + year_positions
+        bin_positions, bin_counts = np.unique(positions * n_bins + bins, return_counts=True)
+        counts.reshape(-1)[bin_positions] += bin_counts.astype(np.int32)
+
+        deviations = values - mean[cell_positions, year_positions]
+        squared_deviations += np.bincount(positions, weights=deviations ** 2, minlength=n_cells * n_years)
+
+    print('Streamed ' + str(nrows) + ' ensemble member rows of ' + variable + ' from ' + filename)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(squared_deviations.reshape(n_cells, n_years) / (n_members - 1))
+
+    statistics = {'count': n_members.astype(float), 'mean': mean, 'std': std, 'min': minimum, 'max': maximum,
+                  'median': interpolate_histogram_quantiles(counts, minimum, maximum, 0.5)}
+    for quantile in quantiles:
+        statistics[get_quantile_name(quantile)] = interpolate_histogram_quantiles(counts, minimum, maximum,
+                                                                                  quantile)
+    for name in statistics:
+        statistics[name] = np.where(n_members > 0, statistics[name], np.nan)
+
+    if len(units) == 1:
+        unit = list(units)[0]
+    else:
+        print('WARNING: ' + variable + ' has different units (' + str(sorted(units)) + ') in ' + filename
+              + '. Please check your input data!')
+        unit = 'mixed'
+
+    if source_name is None:
+        source_name = os.path.splitext(os.path.basename(filename))[0]
+    years = [column.lstrip('Y') for column in year_columns]
+    ensemble_positions = cells.get_level_values(0)
+
+    results = {}
+    for ensemble_number, ensemble in enumerate(ensemble_names):
+        in_ensemble = np.asarray(ensemble_positions == ensemble_number)
+
+        for name, values in statistics.items():
+
+            new_data = pd.DataFrame(values[in_ensemble], index=cells.get_level_values(1)[in_ensemble],
+                                    columns=years)
+            new_data = new_data.dropna(axis=0, how='all')
+            new_data.index.name = 'country'
+            new_data = new_data.reset_index()
+            new_data['scenario'] = ensemble
+            new_data['source'] = source_name
+            new_data['unit'] = 'number of members' if name == 'count' else unit
+            new_data['variable'] = variable
+            new_data['statistic'] = name
+            new_data = new_data[['country', 'scenario', 'source', 'unit', 'variable', 'statistic'] + years]
+
+            results[(ensemble, name)] = new_data
+
+            if write_files and not new_data.empty:
+                fname_out = '_'.join([source_name, variable, ensemble, name])
+                fname_out = re.sub(r"[^A-Za-z0-9._-]+", '-', fname_out) + '.csv'
+                fullfname_out = os.path.join(output_folder, fname_out)
+                if not os.path.exists(output_folder):
+                    os.makedirs(output_folder)
+                new_data.to_csv(fullfname_out, index=False)
+                print('Processed data written to file! - ' + fullfname_out)
+
+    return results
@@ -0,0 +1,214 @@
+# Project and Title: Global Stocktake Toolkit - ranks and percentiles
+
+# Purpose: Where does a country sit in the distribution of all countries, for every
+# year, every indicator and every trend window? The data for all indicators are put
+# into one (indicator, country, year) cube and ranked with a single argsort over the
+# countries. Tied values share the average rank and missing values are not ranked.
+# The result can be queried per country (get_country_trajectory) without any search.
+
+# =====================================================
+
+import pandas as pd
+import numpy as np
+
+from .trend_metrics import calculate_trend_metric
+from .instrumentation import instrument
+
+# ======================
+
+rank_measures = ['value', 'rank', 'percentile', 'n_countries']
+
+
+def rank_along_first_axis(values, descending=False):
+
+    """
+    Ranks of the values in each column of a 2D array, all columns at once. Rank 1 is the lowest
+    value (the highest if descending is True), tied values get the average of their ranks and
+    NaNs get NaN. Returns the ranks and the number of ranked values in each column.
+    """
+
+    n_rows = values.shape[0]
+    valid = ~np.isnan(values)
+    n_valid = valid.sum(axis=0)
+
+    # NaNs are sorted to the end of each column
+    sort_values = -values if descending else values
+    order = np.argsort(sort_values, axis=0, kind='mergesort')
+    sorted_values = np.take_along_axis(sort_values, order, axis=0)
+
+    # start and end position of each run of tied values
+    positions = np.arange(n_rows)[:, np.newaxis] * np.ones(values.shape[1], dtype=int)[np.newaxis, :]
+    new_run = np.ones(values.shape, dtype=bool)
+    new_run[1:] = sorted_values[1:] != sorted_values[:-1]
+    run_start = np.maximum.accumulate(np.where(new_run, positions, 0), axis=0)
+
+    run_end_flag = np.ones(values.shape, dtype=bool)
+    run_end_flag[:-1] = new_run[1:]
+    run_end = np.minimum.accumulate(np.where(run_end_flag, positions, n_rows)[::-1], axis=0)[::-1]
+
+    sorted_ranks = (run_start + run_end) / 2 + 1
+    sorted_ranks[positions >= n_valid[np.newaxis, :]] = np.nan
+
+    ranks = np.empty(values.shape)
+    np.put_along_axis(ranks, order, sorted_ranks, axis=0)
+
+    return ranks, n_valid
+
+
+def calculate_percentiles(ranks, n_valid, descending=False):
+
+    """
+    Percentile of each value within its column: the % of ranked values below it, counting tied
+    values as half below. Always measured from the lowest value, whichever way the ranks go.
+    """
+
+    n_valid = n_valid.astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if descending:
+            percentiles = 100 * (n_valid - ranks + 0.5) / n_valid
+        else:
+            percentiles = 100 * (ranks - 0.5) / n_valid
+
+    return percentiles
+
+
+@instrument
+def calculate_ranks(df, descending=False):
+
+    """
+    Rank and percentile of each country (index) in each year (columns) of a dataframe.
+    Returns the ranks, the percentiles and the number of countries ranked in each year.
+    """
+
+    ranks, n_valid = rank_along_first_axis(df.values.astype(float), descending=descending)
+    percentiles = calculate_percentiles(ranks, n_valid[np.newaxis, :], descending=descending)
+
+    df_ranks = pd.DataFrame(ranks, index=df.index, columns=df.columns)
+    df_percentiles = pd.DataFrame(percentiles, index=df.index, columns=df.columns)
+    n_countries = pd.Series(n_valid, index=df.columns, name='n_countries')
+
+    return df_ranks, df_percentiles, n_countries
+
+
+def make_indicator_set(indicators, trend_windows=(5, 10), trend_metric='mean_annual_change', units=None):
+
+    """
+    Adds the trends of each indicator (dict of name -> dataframe, countries x years) over each of
+    the trend_windows to the set, named 'name-trend-Nyr'. 'units' is an optional dict of the unit
+    of each indicator, needed for the 'slope' metric.
+    """
+
+    indicator_set = dict(indicators)
+
+    for name, df in indicators.items():
+        unit_ = units[name] if units else ''
+        for window in trend_windows:
+            df_trend, trend_unit = calculate_trend_metric(df, unit_, metric=trend_metric, num_years_trend=window)
+            indicator_set[name + '-trend-' + str(window) + 'yr'] = df_trend
+
+    return indicator_set
+
+
+@instrument
+def build_rank_cube(indicators, descending=False):
+
+    """
+    Ranks all countries for every indicator (dict of name -> dataframe, countries x years) and every
+    year with one argsort. The indicators are put on the same countries and years (the union; cells
+    with no data are not ranked). 'descending' is True / False for all indicators, or a dict with a
+    value for each indicator.
+
+    Returns a dict with the cubes 'value', 'rank' and 'percentile' (indicator x country x year), the
+    'n_countries' ranked (indicator x year), the 'indicators', 'countries' and 'years' along the axes
+    and 'country_position', which maps each country to its position along the country axis.
+    """
+
+    names = list(indicators)
+
+    countries = indicators[names[0]].index
+    years = indicators[names[0]].columns
+    for name in names[1:]:
+        countries = countries.union(indicators[name].index)
+        years = years.union(indicators[name].columns)
+    years = sorted(years, key=int)
+
+    values = np.stack([indicators[name].reindex(index=countries, columns=years).values.astype(float)
+                       for name in names])
+    n_indicators, n_countries, n_years = values.shape
+
+    if isinstance(descending, dict):
+        descending = np.array([descending.get(name, False) for name in names])
+    else:
+        descending = np.full(n_indicators, bool(descending))
+
+    # flip the sign of descending indicators so that one ascending sort does them all
+    sign = np.where(descending, -1., 1.)[:, np.newaxis, np.newaxis]
+
+    # countries x (indicators * years)
+    flat_values = (sign * values).transpose(1, 0, 2).reshape(n_countries, n_indicators * n_years)
+    flat_ranks, flat_n_valid = rank_along_first_axis(flat_values)
+
+    ranks = flat_ranks.reshape(n_countries, n_indicators, n_years).transpose(1, 0, 2)
+    n_valid = flat_n_valid.reshape(n_indicators, n_years)
+
+    percentiles = np.where(descending[:, np.newaxis, np.newaxis],
+                           calculate_percentiles(ranks, n_valid[:, np.newaxis, :], descending=True),
+                           calculate_percentiles(ranks, n_valid[:, np.newaxis, :], descending=False))
+
+    rank_cube = {
+        'value': values,
+        'rank': ranks,
+        'percentile': percentiles,
+        'n_countries': n_valid,
+        'indicators': names,
+        'countries': list(countries),
+        'years': list(years),
+        'country_position': {country: position for position, country in enumerate(countries)},
+    }
+
+    return rank_cube
+
+
+def get_country_trajectory(rank_cube, country):
+
+    """
+    Value, rank, percentile and number of countries ranked for one country, for all indicators and
+    years. The country is found with a dict lookup, so the cost doesn't depend on the number of
+    countries. Returns a dataframe indexed by (indicator, measure) with years as columns.
+    """
+
+    if country not in rank_cube['country_position']:
+        print(str(country) + ' is not in the rank cube, please try again.')
+        return
+
+    position = rank_cube['country_position'][country]
+
+    trajectory = np.stack([rank_cube['value'][:, position, :],
+                           rank_cube['rank'][:, position, :],
+                           rank_cube['percentile'][:, position, :],
+                           rank_cube['n_countries']], axis=1)
+
+    index = pd.MultiIndex.from_product([rank_cube['indicators'], rank_measures], names=['indicator', 'measure'])
+    trajectory = pd.DataFrame(trajectory.reshape(-1, len(rank_cube['years'])), index=index,
+                              columns=rank_cube['years'])
+
+    return trajectory
+
+
+def make_trajectory_table(rank_cube):
+
+    """
+    The rank cube as one table, indexed by (country, indicator) with a column for each
+    measure ('value', 'rank', 'percentile') and year, e.g. table.loc[(country, indicator), 'percentile'].
+    """
+
+    n_indicators, n_countries, n_years = rank_cube['value'].shape
+
+    measures = [rank_cube[measure].transpose(1, 0, 2).reshape(n_countries * n_indicators, n_years)
+                for measure in rank_measures[:3]]
+
+    index = pd.MultiIndex.from_product([rank_cube['countries'], rank_cube['indicators']],
+                                       names=['country', 'indicator'])
+    columns = pd.MultiIndex.from_product([rank_measures[:3], rank_cube['years']], names=['measure', 'year'])
+
+    return pd.DataFrame(np.concatenate(measures, axis=1), index=index, columns=columns)
@@ -0,0 +1,184 @@
+# Project and Title: Global Stocktake Toolkit - release comparison
+
+# Purpose: Compare two releases of a dataset (e.g. PRIMAP-hist v1.1 and v2.0) to see
+# which country-year values have been added, removed or changed - and by how much -
+# before re-publishing plots. Rows are aligned on hashes of their keys
+# (country, category, entity, ...) rather than by merging the full tables, and
+# all cells are compared at once.
+
+# =====================================================
+
+import os
+import re
+import glob
+
+import pandas as pd
+import numpy as np
+
+from .data_ingestion import read_raw_data
+from .instrumentation import instrument
+
+# ======================
+
+# older releases use different names for the same columns
+column_renames = {'ISO': 'country', 'sectorCode': 'category'}
+
+default_key_columns = ['scenario', 'country', 'category', 'entity']
+
+
+def find_year_columns(columns):
+
+    return [column for column in columns if re.match(r"[0-9]{4}$", str(column)) is not None]
+
+
+def hash_row_keys(df, key_columns):
+
+    """
+    One 64 bit hash per row, calculated from the key columns.
+    """
+
+    keys = df[key_columns].astype(str)
+
+    return pd.util.hash_pandas_object(keys, index=False).values
+
+
+@instrument
+def compare_releases(old_file, new_file, key_columns=None, rtol=0.01, atol=0.,
+                     proc_data_folder='proc-data', plot_folder=os.path.join('output', 'plots'),
+                     source_name=None, verbose=True):
+
+    """
+    Compares two releases of a dataset on the rows (key_columns) and years they have in common.
+    A value has 'changed' if it differs by more than atol + rtol * |old value|, has been 'added'
+    if it was missing in the old release and 'removed' if it is missing in the new release.
+    Rows that are only in one release are also counted.
+
+    Returns a dict with:
+        'summary' - counts of added, removed and changed rows and cells
+        'changes' - a table of all changed, added and removed cells (long format)
+        'affected_files' - proc-data files (and their plots) that contain changed country-years,
+                           see find_affected_files.
+    """
+
+    old = read_raw_data(old_file, value_dtype='float64', verbose=False).rename(columns=column_renames)
+    new = read_raw_data(new_file, value_dtype='float64', verbose=False).rename(columns=column_renames)
+
+    if key_columns is None:
+        key_columns = [column for column in default_key_columns if (column in old.columns) and (column in new.columns)]
+
+    years = sorted(set(find_year_columns(old.columns)).intersection(find_year_columns(new.columns)), key=int)
+
+    old_hashes = hash_row_keys(old, key_columns)
+    new_hashes = hash_row_keys(new, key_columns)
+
+    # keys must be unique, otherwise rows can't be aligned
+    old_unique = ~pd.Index(old_hashes).duplicated()
+    new_unique = ~pd.Index(new_hashes).duplicated()
+    if not (old_unique.all() and new_unique.all()):
+        print('WARNING: the key columns ' + str(key_columns) + ' do not identify rows uniquely! '
+              'Only the first row of each key is compared.')
+        old, old_hashes = old.loc[old_unique], old_hashes[old_unique]
+        new, new_hashes = new.loc[new_unique], new_hashes[new_unique]
+
+    # position of each new row in the old release (-1 if not there)
+    old_positions = pd.Index(old_hashes).get_indexer(new_hashes)
+    in_both = old_positions >= 0
+
+    rows_added = int((~in_both).sum())
+    rows_removed = int(len(old) - in_both.sum())
+
+    old_values = old[years].values[old_positions[in_both]]
+    new_values = new[years].values[in_both]
+
+    old_valid = ~np.isnan(old_values)
+    new_valid = ~np.isnan(new_values)
+
+    with np.errstate(invalid='ignore'):
+        difference = new_values - old_values
+        changed = old_valid & new_valid & (np.abs(difference) > (atol + rtol * np.abs(old_values)))
+    added = ~old_valid & new_valid
+    removed = old_valid & ~new_valid
+
+    # long table of the cells that differ
+    row_numbers, year_numbers = np.nonzero(changed | added | removed)
+    new_rows = np.flatnonzero(in_both)[row_numbers]
+    changes = new[key_columns].iloc[new_rows].reset_index(drop=True)
+    changes = changes.astype(str)
+    changes['year'] = np.array(years)[year_numbers]
+    changes['old_value'] = old_values[row_numbers, year_numbers]
+    changes['new_value'] = new_values[row_numbers, year_numbers]
+    changes['change'] = difference[row_numbers, year_numbers]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        changes['relative_change'] = changes['change'] / changes['old_value'].abs()
+    changes['status'] = np.where(changed[row_numbers, year_numbers], 'changed',
+                                 np.where(added[row_numbers, year_numbers], 'added', 'removed'))
+
+    summary = {'rows_compared': int(in_both.sum()), 'rows_added': rows_added, 'rows_removed': rows_removed,
+               'years_compared': len(years),
+               'cells_changed': int(changed.sum()), 'cells_added': int(added.sum()),
+               'cells_removed': int(removed.sum())}
+
+    affected_files = find_affected_files(changes, proc_data_folder=proc_data_folder, plot_folder=plot_folder,
+                                         source_name=source_name)
+
+    if verbose:
+        print('Compared ' + str(summary['rows_compared']) + ' rows and ' + str(len(years)) + ' years:')
+        for name in ['rows_added', 'rows_removed', 'cells_changed', 'cells_added', 'cells_removed']:
+            print('   ' + name.replace('_', ' ') + ': ' + str(summary[name]))
+        if affected_files:
+            print('Affected processed data files:')
+            for fname, plots in affected_files.items():
+                print('   ' + fname + ' (' + str(len(plots)) + ' plots)')
+
+    return {'summary': summary, 'changes': changes, 'affected_files': affected_files}
+
+
+def find_affected_files(changes, proc_data_folder='proc-data', plot_folder=os.path.join('output', 'plots'),
+                        source_name=None):
+
+    """
+    Finds the proc-data files that contain any of the changed country-years (matched on category,
+    if the file has one, country and year), optionally only those whose 'source' starts with
+    source_name. Processed files don't keep the original entity, so files are matched on
+    category rather than on the exact variable - the result lists files that may be affected.
+    Returns a dict of proc-data file -> list of plots in plot_folder made from that file's variable.
+    """
+
+    affected = {}
+    if changes.empty or not os.path.exists(proc_data_folder):
+        return affected
+
+    if 'category' in changes.columns:
+        changed_cells = set(zip(changes['category'], changes['country'], changes['year']))
+    changed_country_years = set(zip(changes['country'], changes['year']))
+
+    plots = glob.glob(os.path.join(plot_folder, '*'))
+
+    for fname in sorted(glob.glob(os.path.join(proc_data_folder, '**', '*.csv'), recursive=True)):
+
+        header = pd.read_csv(fname, nrows=0)
+        if 'country' not in header.columns:
+            continue
+        metadata = [column for column in ['country', 'category', 'source', 'variable'] if column in header.columns]
+        years = find_year_columns(header.columns)
+        data = pd.read_csv(fname, usecols=metadata + years, dtype={column: str for column in metadata})
+
+        if source_name and ('source' in data.columns):
+            data = data.loc[data['source'].str.startswith(source_name)]
+        if data.empty:
+            continue
+
+        # all country-years with data in the file
+        cells = data.melt(id_vars=metadata, value_vars=years, var_name='year').dropna(subset=['value'])
+
+        if ('category' in cells.columns) and ('category' in changes.columns):
+            is_affected = any(cell in changed_cells for cell in zip(cells['category'], cells['country'], cells['year']))
+        else:
+            is_affected = any(cell in changed_country_years for cell in zip(cells['country'], cells['year']))
+
+        if is_affected:
+            variables = data['variable'].unique() if 'variable' in data.columns else []
+            affected[fname] = sorted(plot for plot in plots
+                                     if any(variable in os.path.basename(plot) for variable in variables))
+
+    return affected
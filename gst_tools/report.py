@@ -0,0 +1,179 @@
+# Project and Title: Global Stocktake Toolkit - PDF reports
+
+# Purpose: Build a single multi-page PDF report from a list of plots, instead of saving
+# hundreds of separate files and merging them by hand. Each plot is described by a spec
+# (which make_plots function to call and with what) and the pages are rendered in
+# parallel worker processes. Pages are written to the PDF as soon as they are ready and
+# in order, with only a few in memory at any time, so memory doesn't grow with the
+# number of pages. An optional table of contents goes at the front.
+
+# Example:
+#     specs = [{'function': 'make_histogram', 'args': [data_years['2017'], 'Mt'],
+#               'kwargs': {'remove_outliers': True}, 'title': 'Emissions in 2017'}, ...]
+#     build_pdf_report(specs, 'output/reports/emissions.pdf', title='Emissions', toc=True)
+
+# =====================================================
+
+import io
+import os
+import contextlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .instrumentation import instrument
+
+# ======================
+
+# A4 landscape, inches
+page_size = (11.69, 8.27)
+toc_entries_per_page = 35
+
+
+def render_page(spec, dpi=150):
+
+    """
+    Makes the plot described by the spec in this process and returns it as PNG bytes.
+    spec['function'] is the name of a make_plots function (or any function that draws on the
+    current matplotlib figure), called with spec['args'] and spec['kwargs']. Don't set save_plot,
+    as that closes the figure. Printing from the plot function is suppressed.
+    """
+
+    # the worker only ever writes to file
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    from . import make_plots
+    make_plots.import_plotting_modules()
+
+    function = spec['function']
+    if isinstance(function, str):
+        function = getattr(make_plots, function)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        function(*spec.get('args', []), **spec.get('kwargs', {}))
+
+    if not plt.get_fignums():
+        raise RuntimeError('No figure was made for ' + get_page_title(spec, 0))
+
+    image = io.BytesIO()
+    plt.gcf().savefig(image, format='png', dpi=dpi, bbox_inches='tight')
+    plt.close('all')
+
+    return image.getvalue()
+
+
+def get_page_title(spec, number):
+
+    if 'title' in spec:
+        return spec['title']
+
+    function = spec['function']
+    name = function if isinstance(function, str) else function.__name__
+
+    return name + ' (' + str(number) + ')'
+
+
+def add_image_page(pdf, image, title, page_number):
+
+    """
+    Adds a page with the rendered plot (PNG bytes), scaled to fit, and a footer to the PDF.
+    """
+
+    import matplotlib.pyplot as plt
+
+    picture = plt.imread(io.BytesIO(image), format='png')
+
+    fig = plt.figure(figsize=page_size)
+    axs = fig.add_axes([0.03, 0.07, 0.94, 0.88])
+    axs.imshow(picture, interpolation='none')
+    axs.axis('off')
+    fig.text(0.03, 0.03, title, fontsize=9, color='grey', ha='left')
+    fig.text(0.97, 0.03, str(page_number), fontsize=9, color='grey', ha='right')
+
+    pdf.savefig(fig)
+    plt.close(fig)
+
+
+def add_toc_pages(pdf, titles, first_page_number, report_title=''):
+
+    """
+    Adds the table of contents (page titles and numbers) to the PDF, over as many pages as needed.
+    """
+
+    import matplotlib.pyplot as plt
+
+    for start in range(0, len(titles), toc_entries_per_page):
+
+        fig = plt.figure(figsize=page_size)
+        top = 0.9
+        if start == 0:
+            fig.text(0.08, 0.92, report_title if report_title else 'Contents', fontsize=18, fontweight='bold')
+            top = 0.85
+
+        entries = titles[start:(start + toc_entries_per_page)]
+        for i, title in enumerate(entries):
+            y = top - i * (top - 0.05) / toc_entries_per_page
+            fig.text(0.08, y, title, fontsize=10, ha='left')
+            fig.text(0.92, y, str(first_page_number + start + i), fontsize=10, ha='right')
+
+        pdf.savefig(fig)
+        plt.close(fig)
+
+
+@instrument
+def build_pdf_report(specs, filename, title='', toc=True, dpi=150, max_workers=None, max_pages_in_memory=None):
+
+    """
+    Renders each plot spec (see render_page) in parallel worker processes and writes them, in
+    order, to one multi-page PDF, with a table of contents first if toc is True. By default there
+    is one worker per CPU. At most max_pages_in_memory rendered pages (default: twice the number
+    of workers) are waiting to be written at any time. The plots are put on the pages as images
+    at the given dpi.
+    Returns the number of plot pages written.
+    """
+
+    from .make_plots import import_plotting_modules
+    import_plotting_modules()
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_pages_in_memory is None:
+        max_pages_in_memory = 2 * max_workers
+
+    folder = os.path.dirname(filename)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    titles = [get_page_title(spec, number + 1) for number, spec in enumerate(specs)]
+    n_toc_pages = -(-len(titles) // toc_entries_per_page) if toc else 0
+
+    n_pages = 0
+    with PdfPages(filename, metadata={'Title': title}) as pdf, \
+            ProcessPoolExecutor(max_workers=max_workers) as executor:
+
+        if toc:
+            add_toc_pages(pdf, titles, n_toc_pages + 1, report_title=title)
+
+        # keep a limited number of pages on the go; write them in order as they finish
+        remaining = iter(enumerate(specs))
+        pending = deque()
+        for number, spec in remaining:
+            pending.append(executor.submit(render_page, spec, dpi))
+            if len(pending) >= max_pages_in_memory:
+                break
+
+        while pending:
+            image = pending.popleft().result()
+            add_image_page(pdf, image, titles[n_pages], n_toc_pages + n_pages + 1)
+            n_pages += 1
+
+            next_spec = next(remaining, None)
+            if next_spec is not None:
+                pending.append(executor.submit(render_page, next_spec[1], dpi))
+
+    print('Report with {} pages written to {}'.format(n_toc_pages + n_pages, filename))
+
+    return n_pages
+
@@ -0,0 +1,168 @@
+# Project and Title: Global Stocktake Toolkit - trend metrics
+
+# Purpose: Trend metrics in addition to the rolling average of the annual % change
+# (gst_utils.calculate_trends), which is noisy for small, volatile emitters:
+#   - rolling OLS slope (absolute, and normalised to the mean of the window)
+#   - log-linear growth rate (OLS slope of the log of the data)
+#   - compound annual growth rate between the end points of the window
+# All are calculated for every country and year at once from cumulative sums over
+# the years, rather than fitting each country separately.
+
+# =====================================================
+
+import pandas as pd
+import numpy as np
+
+from .gst_utils import calculate_trends
+from .instrumentation import instrument
+
+# ======================
+
+trend_metric_names = ['mean_annual_change', 'slope', 'normalised_slope', 'log_linear_growth', 'cagr']
+
+
+def rolling_sum(array, window):
+
+    """
+    Sum over a rolling window along the years (axis 1) of a 2D array, using cumulative sums.
+    The window ends in each year; years without a full window are NaN.
+    """
+
+    cumulative = np.concatenate([np.zeros((array.shape[0], 1)), np.cumsum(array, axis=1)], axis=1)
+
+    window_sum = np.full(array.shape, np.nan)
+    window_sum[:, (window - 1):] = cumulative[:, window:] - cumulative[:, :-window]
+
+    return window_sum
+
+
+def rolling_ols(values, window, min_valid_years):
+
+    """
+    Slope and mean of an ordinary least squares fit against time over a rolling window, for all
+    rows and years at once. Missing values are left out of the fit; windows with fewer than
+    min_valid_years valid values are NaN.
+    """
+
+    valid = ~np.isnan(values)
+    y = np.where(valid, values, 0.)
+    x = np.where(valid, np.arange(values.shape[1], dtype=float)[np.newaxis, :], 0.)
+
+    n = rolling_sum(valid.astype(float), window)
+    sum_x = rolling_sum(x, window)
+    sum_y = rolling_sum(y, window)
+    sum_xx = rolling_sum(x * x, window)
+    sum_xy = rolling_sum(x * y, window)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sxx = sum_xx - sum_x * sum_x / n
+        sxy = sum_xy - sum_x * sum_y / n
+        slope = sxy / sxx
+        mean = sum_y / n
+
+    enough_data = (n >= max(2, min_valid_years)) & (sxx > 0)
+    slope[~enough_data] = np.nan
+    mean[~enough_data] = np.nan
+
+    return slope, mean
+
+
+@instrument
+def calculate_rolling_slope(df, num_years_trend=10, normalise=False, min_valid_years=None):
+
+    """
+    Rolling OLS slope over the last num_years_trend years (i.e. num_years_trend + 1 data points, the
+    same period as calculate_trends) for every country and year, in units per year. If normalise is
+    True, the slope is divided by the mean of the window and given in % per year.
+    By default the whole window must have data.
+    """
+
+    window = num_years_trend + 1
+    if min_valid_years is None:
+        min_valid_years = window
+
+    slope, mean = rolling_ols(df.values.astype(float), window, min_valid_years)
+
+    if normalise:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = 100 * slope / mean
+        slope[~np.isfinite(slope)] = np.nan
+
+    return pd.DataFrame(slope, index=df.index, columns=df.columns)
+
+
+@instrument
+def calculate_log_linear_growth(df, num_years_trend=10, min_valid_years=None):
+
+    """
+    Growth rate (% per year) from an OLS fit of the log of the data over a rolling window of the last
+    num_years_trend years. Less sensitive to single noisy years than the mean annual change.
+    Only positive values can be used.
+    """
+
+    window = num_years_trend + 1
+    if min_valid_years is None:
+        min_valid_years = window
+
+    values = df.values.astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_values = np.where(values > 0, np.log(values), np.nan)
+
+    log_slope, _ = rolling_ols(log_values, window, min_valid_years)
+    growth = 100 * (np.exp(log_slope) - 1)
+
+    return pd.DataFrame(growth, index=df.index, columns=df.columns)
+
+
+@instrument
+def calculate_cagr(df, num_years_trend=10):
+
+    """
+    Compound annual growth rate (% per year) between the first and last year of a rolling window
+    of num_years_trend years. Only positive values can be used.
+    """
+
+    values = df.values.astype(float)
+    n = num_years_trend
+
+    cagr = np.full(values.shape, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = values[:, n:] / values[:, :-n]
+        ratio[~((values[:, n:] > 0) & (values[:, :-n] > 0))] = np.nan
+        cagr[:, n:] = 100 * (ratio ** (1 / n) - 1)
+
+    return pd.DataFrame(cagr, index=df.index, columns=df.columns)
+
+
+def calculate_trend_metric(df, unit_, metric='mean_annual_change', num_years_trend=10):
+
+    """
+    Calculates the chosen trend metric so that the histogram and peaking analysis can switch
+    between trend definitions. Options are:
+        'mean_annual_change' - rolling average of the annual % change (calculate_trends)
+        'slope' - rolling OLS slope, in unit_ per year
+        'normalised_slope' - rolling OLS slope divided by the mean of the window, in % per year
+        'log_linear_growth' - growth rate from an OLS fit of the log of the data, in % per year
+        'cagr' - compound annual growth rate between the end points of the window, in % per year
+    Returns the trend (countries x years) and its unit.
+    """
+
+    if metric == 'mean_annual_change':
+        df_perc_change, df_trend, new_unit = calculate_trends(df, num_years_trend=num_years_trend)
+    elif metric == 'slope':
+        df_trend = calculate_rolling_slope(df, num_years_trend=num_years_trend)
+        new_unit = unit_ + ' / year'
+    elif metric == 'normalised_slope':
+        df_trend = calculate_rolling_slope(df, num_years_trend=num_years_trend, normalise=True)
+        new_unit = '%'
+    elif metric == 'log_linear_growth':
+        df_trend = calculate_log_linear_growth(df, num_years_trend=num_years_trend)
+        new_unit = '%'
+    elif metric == 'cagr':
+        df_trend = calculate_cagr(df, num_years_trend=num_years_trend)
+        new_unit = '%'
+    else:
+        print('Trend metric must be one of ' + str(trend_metric_names) + '. Please try again.')
+        return
+
+    return df_trend, new_unit
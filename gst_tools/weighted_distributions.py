@@ -0,0 +1,95 @@
+# Project and Title: Global Stocktake Toolkit - weighted distributions
+
+# Purpose: Weighted distributions - e.g. the share of the world population (rather than
+# the number of countries) in each bin of a per capita indicator, and population-weighted
+# quantiles. The weights (e.g. UN-population-data-2017.csv) are aligned with the
+# indicator and the counts and quantiles are calculated for all years at once.
+# make_plots.make_weighted_histogram plots a single year.
+
+# =====================================================
+
+import pandas as pd
+import numpy as np
+
+from .convergence import sort_with_weights, weighted_quantiles_sorted
+from .distribution_stats import default_quantiles
+from .gst_utils import align_datasets
+from .instrumentation import instrument
+
+# ======================
+
+
+def weighted_quantile(values, weights, quantiles):
+
+    """
+    Weighted quantiles of a 1D array of values (NaNs ignored), interpolated between the values
+    (see convergence.weighted_quantiles_sorted). With equal weights these are the np.percentile
+    quantiles, so the weighted median is the median of make_histogram. Returns an array with one
+    value per quantile.
+    """
+
+    values = np.asarray(values, dtype=float)[:, np.newaxis]
+    weights = np.asarray(weights, dtype=float)[:, np.newaxis]
+
+    sorted_values, sorted_weights, cumulative_weights = sort_with_weights(values, weights)
+
+    return weighted_quantiles_sorted(sorted_values, cumulative_weights, quantiles)[:, 0]
+
+
+@instrument
+def calculate_weighted_quantiles(df, df_weights, quantiles=default_quantiles):
+
+    """
+    Weighted quantiles of an indicator (countries x years) in every year, with the weights (e.g.
+    population) of each country and year. Returns a dataframe with years as index and one column
+    per quantile (e.g. 'q50' is the value below which about half of the weight - half of the world
+    population - lives, interpolated between the countries either side).
+    """
+
+    df, df_weights = align_datasets([df, df_weights])
+
+    sorted_values, sorted_weights, cumulative_weights = sort_with_weights(df.values.astype(float),
+                                                                          df_weights.values.astype(float))
+    quantile_values = weighted_quantiles_sorted(sorted_values, cumulative_weights, quantiles)
+
+    return pd.DataFrame(quantile_values.T, index=pd.Index(list(df.columns), name='year'),
+                        columns=['q{:g}'.format(100 * quantile) for quantile in quantiles])
+
+
+@instrument
+def calculate_weighted_counts(df, df_weights, bins='fd', share=True):
+
+    """
+    Weighted histogram of an indicator (countries x years) in every year, using the same bin edges
+    for all years so that the years can be compared. 'bins' is anything np.histogram_bin_edges
+    accepts (a number of bins, a rule such as 'fd', or the edges themselves), applied to all
+    values. If share is True, the counts are in % of the total weight of the year.
+    Returns the counts (years x bins, columns are the left bin edges) and the bin edges.
+    """
+
+    df, df_weights = align_datasets([df, df_weights])
+
+    values = df.values.astype(float)
+    weights = df_weights.values.astype(float)
+    valid = ~np.isnan(values) & ~np.isnan(weights)
+
+    edges = np.histogram_bin_edges(values[valid], bins=bins)
+    n_bins = len(edges) - 1
+    n_years = values.shape[1]
+
+    # bin of every value; the last bin includes its right edge (as in np.histogram)
+    bin_index = np.clip(np.searchsorted(edges, np.where(valid, values, edges[0]), side='right') - 1, 0, n_bins - 1)
+    inside = valid & (values >= edges[0]) & (values <= edges[-1])
+
+    # one bincount over all years: offset each year's bins so that they don't overlap
+    offset_index = bin_index + n_bins * np.arange(n_years)[np.newaxis, :]
+    counts = np.bincount(offset_index[inside], weights=weights[inside],
+                         minlength=n_bins * n_years).reshape(n_years, n_bins)
+
+    if share:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            counts = 100 * counts / counts.sum(axis=1, keepdims=True)
+
+    counts = pd.DataFrame(counts, index=pd.Index(list(df.columns), name='year'), columns=edges[:-1])
+
+    return counts, edges